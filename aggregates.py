@@ -0,0 +1,129 @@
+import sys
+from datetime import date, timedelta
+
+# --- 月度汇总表：由触发器随 logs / workers 的增删改自动维护，打开报表只读汇总行 ---
+# agg_worker: (类型 solar/lunar, 月份, 工人) -> 记录数 n、半天数 half、工钱 money
+# agg_owner:  (类型, 月份, 业主, 工人) -> 半天数、工钱；多带一列工人，改日薪、删工人时才能对得上
+# cal_days:   阳历日期 -> 农历月份键，触发器靠它把一条记录归到农历月
+# 注意：INSERT OR REPLACE 覆盖旧行时要开 PRAGMA recursive_triggers 才会触发删除触发器
+
+def solar_period(d):
+    return d.strftime("%Y-%m")
+
+def lunar_period(d):
+    import lunar_calendar  # 只在补 cal_days、换算报表月份时用到，不拖慢启动
+    ly, lm, _, leap = lunar_calendar.lunar_of(d)
+    return f"{ly:04d}-{lm:02d}" + ("R" if leap else "")  # 闰月排在同号月之后
+
+def period_of(d, is_lunar):
+    return ("lunar", lunar_period(d)) if is_lunar else ("solar", solar_period(d))
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS cal_days (date TEXT PRIMARY KEY, lunar TEXT) WITHOUT ROWID',
+    '''CREATE TABLE IF NOT EXISTS agg_worker (kind TEXT, period TEXT, worker_id INTEGER, n INTEGER, half INTEGER, money REAL,
+                                            PRIMARY KEY (kind, period, worker_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS agg_owner (kind TEXT, period TEXT, owner_id INTEGER, worker_id INTEGER, half INTEGER, money REAL,
+                                           PRIMARY KEY (kind, period, owner_id, worker_id)) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS agg_worker_wid ON agg_worker (worker_id)',
+    'CREATE INDEX IF NOT EXISTS agg_owner_wid ON agg_owner (worker_id)',
+]
+
+# 一条 logs 记录 {R}（NEW 或 OLD）按符号 {s}（1 / -1）计入汇总；工钱始终按当前日薪由半天数算出，不累加浮点误差
+_APPLY = '''
+    INSERT INTO agg_worker (kind, period, worker_id, n, half, money)
+    SELECT k.kind, k.period, {R}.worker_id, {s}, {s} * {HALF}, {s} * {HALF} * 0.5 * COALESCE((SELECT daily_rate FROM workers WHERE id = {R}.worker_id), 0)
+    FROM {PERIODS} k WHERE true
+    ON CONFLICT (kind, period, worker_id) DO UPDATE SET n = n + excluded.n, half = half + excluded.half,
+        money = (half + excluded.half) * 0.5 * COALESCE((SELECT daily_rate FROM workers WHERE id = excluded.worker_id), 0);
+    INSERT INTO agg_owner (kind, period, owner_id, worker_id, half, money)
+    SELECT k.kind, k.period, o.owner_id, {R}.worker_id, {s}, {s} * 0.5 * COALESCE((SELECT daily_rate FROM workers WHERE id = {R}.worker_id), 0)
+    FROM {PERIODS} k,
+         (SELECT {R}.am_owner_id AS owner_id WHERE COALESCE({R}.am, 0) <> 0 AND {R}.am_owner_id IS NOT NULL
+          UNION ALL SELECT {R}.pm_owner_id WHERE COALESCE({R}.pm, 0) <> 0 AND {R}.pm_owner_id IS NOT NULL) o WHERE true
+    ON CONFLICT (kind, period, owner_id, worker_id) DO UPDATE SET half = half + excluded.half,
+        money = (half + excluded.half) * 0.5 * COALESCE((SELECT daily_rate FROM workers WHERE id = excluded.worker_id), 0);
+'''
+_CLEANUP = '''
+    DELETE FROM agg_worker WHERE worker_id = OLD.worker_id AND n = 0;
+    DELETE FROM agg_owner WHERE worker_id = OLD.worker_id AND half = 0;
+'''
+_RECALC = '''
+    UPDATE agg_worker SET money = half * 0.5 * COALESCE(NEW.daily_rate, 0) WHERE worker_id = NEW.id;
+    UPDATE agg_owner SET money = half * 0.5 * COALESCE(NEW.daily_rate, 0) WHERE worker_id = NEW.id;
+'''
+
+def _apply(R, s):
+    periods = f"(SELECT 'solar' AS kind, substr({R}.date, 1, 7) AS period UNION ALL SELECT 'lunar', lunar FROM cal_days WHERE date = {R}.date)"
+    half = f"((COALESCE({R}.am, 0) <> 0) + (COALESCE({R}.pm, 0) <> 0))"
+    return _APPLY.format(R=R, s=s, PERIODS=periods, HALF=half)
+
+# 触发器定义：名称 -> (事件, 语句体)，由 storage.init 统一安装（带暂停开关）
+TRIGGERS = {
+    "agg_logs_ins": ("AFTER INSERT ON logs", _apply("NEW", 1)),
+    "agg_logs_del": ("AFTER DELETE ON logs", _apply("OLD", -1) + _CLEANUP),
+    "agg_logs_upd": ("AFTER UPDATE ON logs", _apply("OLD", -1) + _apply("NEW", 1) + _CLEANUP),
+    "agg_workers_rate": ("AFTER UPDATE OF daily_rate ON workers", _RECALC),
+    "agg_workers_ins": ("AFTER INSERT ON workers", _RECALC),  # 恢复数据时工人可能晚于记录写入
+    "agg_workers_del": ("AFTER DELETE ON workers", _RECALC.replace("NEW.daily_rate", "NULL").replace("NEW.id", "OLD.id")),
+}
+
+def cover_years(conn, *years):
+    """确保 cal_days 含这些年份（前后各多一年），已有的年份按年末一天查一下就跳过"""
+    todo = [y for y in sorted({y for yr in years for y in (yr - 1, yr, yr + 1)})
+            if not conn.execute("SELECT 1 FROM cal_days WHERE date=?", (f"{y:04d}-12-31",)).fetchone()]
+    if not todo: return
+    rows = []
+    for y in todo:
+        d, end = date(y, 1, 1), date(y, 12, 31)
+        while d <= end:
+            rows.append((d.strftime("%Y-%m-%d"), lunar_period(d))); d += timedelta(days=1)
+    conn.executemany("INSERT OR IGNORE INTO cal_days (date, lunar) VALUES (?,?)", rows)
+
+def _log_years(conn):
+    import storage  # storage 也导入本模块，放在函数里；归档库里的年份也要算上
+    lo, hi = conn.execute(storage.over("SELECT (SELECT MIN(date) FROM logs), (SELECT MAX(date) FROM logs)", c=conn)).fetchone()  # 分开写才能各走一次主键
+    years = {date.today().year}
+    if lo and hi: years.update(range(int(lo[:4]), int(hi[:4]) + 1))
+    return years
+
+def rebuild(conn):
+    """按 logs 全量重算汇总表（老库升级、恢复数据后用），已归档年份一起算；调用方负责事务，开事务前先 storage.attach_archives()"""
+    import storage
+    cover_years(conn, *_log_years(conn))
+    conn.execute("DELETE FROM agg_worker"); conn.execute("DELETE FROM agg_owner")
+    for kind, period, src in (("solar", "substr(l.date, 1, 7)", "logs l"), ("lunar", "c.lunar", "logs l JOIN cal_days c ON c.date = l.date")):
+        conn.execute(storage.over(f'''INSERT INTO agg_worker (kind, period, worker_id, n, half, money)
+                         SELECT '{kind}', {period}, l.worker_id, COUNT(*), SUM((COALESCE(l.am, 0) <> 0) + (COALESCE(l.pm, 0) <> 0)), 0
+                         FROM {src} GROUP BY 2, 3''', c=conn))
+        conn.execute(storage.over(f'''INSERT INTO agg_owner (kind, period, owner_id, worker_id, half, money)
+                         SELECT '{kind}', period, owner_id, worker_id, COUNT(*), 0 FROM (
+                             SELECT {period} AS period, l.am_owner_id AS owner_id, l.worker_id FROM {src} WHERE COALESCE(l.am, 0) <> 0 AND l.am_owner_id IS NOT NULL
+                             UNION ALL
+                             SELECT {period}, l.pm_owner_id, l.worker_id FROM {src} WHERE COALESCE(l.pm, 0) <> 0 AND l.pm_owner_id IS NOT NULL)
+                         GROUP BY 2, 3, 4''', c=conn))
+    for t in ("agg_worker", "agg_owner"):
+        conn.execute(f"UPDATE {t} SET money = half * 0.5 * COALESCE((SELECT daily_rate FROM workers WHERE id = {t}.worker_id), 0)")
+
+def init(conn):
+    fresh = conn.execute("SELECT 1 FROM sqlite_master WHERE name='agg_worker'").fetchone() is None
+    for sql in SCHEMA: conn.execute(sql)
+    if fresh: rebuild(conn)
+    else: cover_years(conn, date.today().year)
+
+def worker_report(conn, kind, period):
+    return conn.execute('''SELECT a.worker_id, w.name, a.half * 0.5, a.money FROM agg_worker a JOIN workers w ON w.id = a.worker_id
+                           WHERE a.kind = ? AND a.period = ? AND a.n > 0 ORDER BY a.worker_id''', (kind, period)).fetchall()
+
+def owner_report(conn, kind, period):
+    return conn.execute('''SELECT a.owner_id, o.name, SUM(a.half) * 0.5, SUM(a.money) FROM agg_owner a
+                           JOIN owners o ON o.id = a.owner_id JOIN workers w ON w.id = a.worker_id
+                           WHERE a.kind = ? AND a.period = ? GROUP BY a.owner_id HAVING SUM(a.half) > 0 ORDER BY a.owner_id''', (kind, period)).fetchall()
+
+if __name__ == "__main__":
+    # 老库一次性重建：python aggregates.py [数据库文件]
+    import storage
+    storage.init(sys.argv[1] if len(sys.argv) > 1 else None)
+    storage.attach_archives()
+    with storage.transaction() as c: rebuild(c)
+    print("汇总表已重建：", storage.one("SELECT COUNT(*) FROM agg_worker")[0], "行工人汇总,", storage.one("SELECT COUNT(*) FROM agg_owner")[0], "行业主汇总")
+    storage.close()
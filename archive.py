@@ -0,0 +1,134 @@
+import argparse
+import os
+from datetime import date
+import backup
+import storage
+
+# --- 年度归档：把已经结束的年份的 logs 搬到单独的库文件，热库只留最近的数据 ---
+# 归档库和热库放在同一目录，文件名带版本（热库里每次归档加 1 的计数），登记在热库的 archives 表里；
+# 查询时由 storage.over() 按区间附加，报表、明细、导出看到的仍是一份完整数据。汇总表不动（搬行时暂停触发器），月报照旧。
+# WAL 模式下跨库事务不保证整体原子，所以分两步各自提交：先写归档库并核对行数，再在热库删行、登记；
+# 中途出错或断电，最多多出一个没登记的归档文件（可以直接删掉），不会两边都没有这份数据。
+
+FILE = "attendance_archive_{year}_v{version}.db"
+VERSION_KEY = "archive_version"
+ARCHIVE_SCHEMA = [  # 与升级后的 logs 同结构、同覆盖索引，明细查询在归档库里一样走索引
+    '''CREATE TABLE IF NOT EXISTS {s}.logs (date TEXT NOT NULL, worker_id INTEGER NOT NULL, am_owner_id INTEGER, pm_owner_id INTEGER,
+       am INTEGER NOT NULL DEFAULT 0, pm INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (date, worker_id)) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS {s}.logs_worker_cover ON logs (worker_id, date, am, pm, am_owner_id, pm_owner_id)',
+    'CREATE INDEX IF NOT EXISTS {s}.logs_am_owner_cover ON logs (am_owner_id, date, worker_id, am)',
+    'CREATE INDEX IF NOT EXISTS {s}.logs_pm_owner_cover ON logs (pm_owner_id, date, worker_id, pm)',
+]
+
+def _span(year):
+    return f"{year:04d}-01-01", f"{year:04d}-12-31"
+
+def _count(c, src, year):
+    return c.execute(f"SELECT COUNT(*) FROM {src} WHERE date BETWEEN ? AND ?", _span(year)).fetchone()[0]
+
+def _differ(c, sch, year):
+    """热库和归档库里 year 年的记录是否有不一样的行（两个方向都比）"""
+    hot = "SELECT * FROM main.logs WHERE date BETWEEN ?1 AND ?2"
+    arc = f"SELECT * FROM {sch}.logs WHERE date BETWEEN ?1 AND ?2"
+    return c.execute(f"SELECT EXISTS ({hot} EXCEPT {arc}) OR EXISTS ({arc} EXCEPT {hot})", _span(year)).fetchone()[0]
+
+def status(c=None):
+    """每个有记录的年份：[(年份, 热库行数, 归档行数, 归档文件)]"""
+    c = c or storage.conn()
+    hot = dict(c.execute("SELECT CAST(substr(date, 1, 4) AS INTEGER), COUNT(*) FROM logs GROUP BY 1").fetchall())
+    arc = {y: (n, f) for y, f, n in c.execute("SELECT year, file, rows FROM archives").fetchall()}
+    return [(y, hot.get(y, 0), *arc.get(y, (0, None))) for y in sorted(set(hot) | set(arc))]
+
+def closed(year):
+    return year < date.today().year
+
+def new_file(c, year):
+    """新归档文件的 (版本, 文件名)。版本是 settings 里只增不减的计数，每次归档、恢复归档都加 1：
+    搬行时触发器暂停、变更序号不动，取消归档再归档也不会和别的连接上还附加着的旧库同名。撞上已有文件就往后顺延"""
+    got = c.execute(storage.SETTING_GET_SQL, (VERSION_KEY,)).fetchone()
+    seq, top = c.execute("SELECT (SELECT n FROM change_seq), (SELECT COALESCE(MAX(version), 0) FROM archives)").fetchone()
+    v = max(int(got[0]) if got else 0, seq, top) + 1  # 老库的版本取自变更序号，从它之后接着数
+    while os.path.exists(os.path.join(storage.db_dir(), FILE.format(year=year, version=v))): v += 1
+    c.execute(storage.SETTING_SET_SQL, (VERSION_KEY, str(v)))
+    return v, FILE.format(year=year, version=v)
+
+def create(c, year, version, name):
+    """在连接 c 上附加一个空的新归档库（回滚日志 + FULL 同步，提交即落盘），返回库名"""
+    sch = storage.archive_schema(year, version)
+    c.execute(f"ATTACH DATABASE ? AS {sch}", (os.path.join(storage.db_dir(), name),))
+    c.execute(f"PRAGMA {sch}.journal_mode = DELETE"); c.execute(f"PRAGMA {sch}.synchronous = FULL")
+    for sql in ARCHIVE_SCHEMA: c.execute(sql.format(s=sch))
+    return sch
+
+def discard(c, sch, name):
+    """丢掉没登记的归档文件（出错回退时用）"""
+    try: c.execute(f"DETACH DATABASE {sch}")
+    except Exception: pass
+    try: os.remove(os.path.join(storage.db_dir(), name))
+    except OSError: pass
+
+def archive_year(year):
+    """把 year 年的 logs 搬进新的归档库，返回搬走的行数"""
+    if not closed(year): raise ValueError("只能归档已经结束的年份")
+    c = storage.conn()
+    if any(y == year for y, _, _ in storage.archives(c)): raise ValueError(f"{year} 年已经归档")
+    n = _count(c, "main.logs", year)
+    if not n: raise ValueError(f"{year} 年没有记录")
+    version, name = new_file(c, year)
+    sch = create(c, year, version, name)
+    try:
+        # 第一步：写归档库并提交
+        with storage.transaction():
+            c.execute(f"INSERT INTO {sch}.logs SELECT * FROM main.logs WHERE date BETWEEN ? AND ?", _span(year))
+            got = _count(c, f"{sch}.logs", year)
+            if got != n: raise RuntimeError(f"归档库写入 {got} 行，应为 {n} 行")
+        # 第二步：热库里删行并登记；两边逐行一致才删（两步之间有人改了某条记录，行数不变也要拦下）
+        with storage.transaction(), storage.triggers_paused(c):
+            if _count(c, "main.logs", year) != n or _differ(c, sch, year): raise RuntimeError("归档期间有记录被修改，请重试")
+            gone = c.execute("DELETE FROM main.logs WHERE date BETWEEN ? AND ?", _span(year)).rowcount
+            if gone != n or _count(c, f"{sch}.logs", year) != n: raise RuntimeError(f"行数核对不一致：删除 {gone} 行，归档 {n} 行")
+            c.execute("INSERT INTO archives (year, file, rows, version, archived) VALUES (?,?,?,?,?)", (year, name, n, version, date.today().strftime("%Y-%m-%d")))
+            c.execute(backup.RESET_BACKUP_SQL)  # 搬行时触发器暂停，变更日志里没有这些行，下次自动备份发全量
+    except:
+        discard(c, sch, name); raise
+    finally: storage.forget_archives()
+    return n
+
+def unarchive(year):
+    """把 year 年的记录搬回热库并删掉归档文件，返回搬回的行数"""
+    c = storage.conn()
+    entry = [a for a in storage.archives(c) if a[0] == year]
+    if not entry: raise ValueError(f"{year} 年没有归档")
+    _, name, version = entry[0]
+    (sch,) = storage.attach(c, entry)
+    try:
+        with storage.transaction(), storage.triggers_paused(c):
+            n = c.execute("SELECT rows FROM archives WHERE year=?", (year,)).fetchone()[0]
+            got = _count(c, f"{sch}.logs", year)
+            if got != n: raise RuntimeError(f"归档库里有 {got} 行，登记的是 {n} 行，文件可能损坏")
+            c.execute(f"INSERT INTO main.logs SELECT * FROM {sch}.logs")  # 热库里这一年本该没有数据，主键冲突就整体回滚
+            if _count(c, "main.logs", year) != n: raise RuntimeError("搬回热库的行数不一致")
+            c.execute("DELETE FROM archives WHERE year=?", (year,))
+            c.execute("DELETE FROM settings WHERE key=?", (f"archive_sent_{year}",))
+            c.execute(backup.RESET_BACKUP_SQL)
+    finally: storage.forget_archives()
+    discard(c, sch, name)
+    return n
+
+def changed():
+    """和上次发出的版本不同的归档 [(年份, 文件, 版本)]，自动备份只带这些"""
+    return [a for a in storage.archives() if storage.get_setting(f"archive_sent_{a[0]}") != str(a[2])]
+
+if __name__ == "__main__":
+    # python archive.py list | archive 2023 | unarchive 2023 [--db 库文件]
+    ap = argparse.ArgumentParser(description="年度归档")
+    ap.add_argument("action", choices=("list", "archive", "unarchive"))
+    ap.add_argument("year", type=int, nargs="?")
+    ap.add_argument("--db")
+    a = ap.parse_args()
+    storage.init(a.db)
+    if a.action == "list":
+        for y, hot, arc, f in status(): print(y, f"热库 {hot} 行", f"归档 {arc} 行 {f}" if f else "")
+    elif a.action == "archive": print(f"{a.year} 年已归档 {archive_year(a.year)} 行")
+    else: print(f"{a.year} 年已搬回 {unarchive(a.year)} 行")
+    storage.close()
@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import smtplib
+import tempfile
+from datetime import date
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+import archive
+import storage
+
+# --- 备份：按 storage 的变更日志出增量/全量快照，逐行写入 gzip 附件 ---
+# 增量备份只导出序号大于上次备份的行，删除的行导出为墓碑。
+# 文件格式：每行一个 JSON，第一行是头 {"format", "version", "kind": full/delta, "since", "seq", "date"}，
+# 之后是 {"t": 表名, "r": 整行} 或 {"t": 表名, "del": 主键}。恢复见 restore 模块。
+# 已归档的年份不在热库的全量 / 增量里，每个归档库单独一个附件（kind: archive，整年快照）：
+# 手动备份带上全部归档，自动备份只带上次发出之后变过的。
+
+FORMAT = "attendance-backup"
+FULL_EVERY_DAYS = 7  # 自动备份至少每 7 天发一次全量
+# 绕过变更日志改了数据（暂停触发器的批量写入、库结构升级）之后执行：忘掉增量基线，下次自动备份发全量
+RESET_BACKUP_SQL = "DELETE FROM settings WHERE key IN ('last_backup_seq', 'last_full_date')"
+
+# --- 导出 ---
+def _rows(c, kind, since):
+    """逐行产出要写入备份的记录，不整表载入内存"""
+    for t, (cols, pk) in storage.TABLES.items():
+        col_sql = ", ".join(cols)
+        if kind == "full":
+            for r in c.execute(f"SELECT {col_sql} FROM {t}"): yield {"t": t, "r": list(r)}
+            continue
+        on = " AND ".join(f"x.{k} = c.k{i+1}" for i, k in enumerate(pk))
+        sel = ", ".join(f"x.{k}" for k in cols)
+        for r in c.execute(f"SELECT c.k1, c.k2, x.{pk[0]} IS NOT NULL, {sel} FROM changes c LEFT JOIN {t} x ON {on} WHERE c.tbl = ? AND c.seq > ? ORDER BY c.seq", (t, since)):
+            if r[2]: yield {"t": t, "r": list(r[3:])}
+            else: yield {"t": t, "del": list(r[:len(pk)])}
+
+def write_backup(path, kind="full", since=0):
+    """把全量或增量备份流式写入 gzip 文件，返回 (头信息, 行数)"""
+    c = storage.conn()
+    c.execute("BEGIN")  # 同一读事务里取序号和数据，WAL 下不挡界面写入
+    try:
+        seq = c.execute("SELECT n FROM change_seq").fetchone()[0]
+        head = {"format": FORMAT, "version": 1, "kind": kind, "since": since if kind == "delta" else 0, "seq": seq, "date": date.today().strftime("%Y-%m-%d")}
+        n = 0
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(head) + "\n")
+            for item in _rows(c, kind, since):
+                f.write(json.dumps(item, ensure_ascii=False) + "\n"); n += 1
+    finally: c.execute("COMMIT")
+    return head, n
+
+def write_archive(path, entry):
+    """把一个归档库整年写成 gzip 快照，返回 (头信息, 行数)"""
+    year, _, version = entry
+    c = storage.conn()
+    (sch,) = storage.attach(c, [entry])
+    head = {"format": FORMAT, "version": 1, "kind": "archive", "year": year, "archive_version": version, "seq": None, "since": 0,
+            "rows": c.execute(f"SELECT COUNT(*) FROM {sch}.logs").fetchone()[0], "date": date.today().strftime("%Y-%m-%d")}
+    n = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(head) + "\n")
+        for r in c.execute(f"SELECT {', '.join(storage.TABLES['logs'][0])} FROM {sch}.logs"):
+            f.write(json.dumps({"t": "logs", "r": list(r)}, ensure_ascii=False) + "\n"); n += 1
+    return head, n
+
+def _attach_file(msg, path, name):
+    with open(path, "rb") as f: att = MIMEApplication(f.read(), Name=name)
+    att['Content-Disposition'] = f'attachment; filename="{name}"'
+    msg.attach(att)
+
+def plan_auto():
+    """自动备份发全量还是增量：没有基准、隔了 FULL_EVERY_DAYS 天以上就发全量"""
+    last_seq, last_full = storage.get_setting("last_backup_seq"), storage.get_setting("last_full_date")
+    if last_seq is None or last_full is None: return "full", 0
+    if (date.today() - date.fromisoformat(last_full)).days >= FULL_EVERY_DAYS: return "full", 0
+    return "delta", int(last_seq)
+
+def send(host, user, pwd, to_addr, is_auto=False, smtp=None):
+    """生成备份附件并发送邮件，返回 (是否成功, 提示)。smtp 是已登录的连接时直接复用，用完不关"""
+    kind, since = plan_auto() if is_auto else ("full", 0)
+    fd, path = tempfile.mkstemp(suffix=".jsonl.gz"); os.close(fd)
+    arc_paths = []
+    try:
+        head, n = write_backup(path, kind, since)
+        arcs = []
+        for entry in archive.changed() if is_auto else storage.archives():
+            fd, p = tempfile.mkstemp(suffix=".jsonl.gz"); os.close(fd); arc_paths.append(p)
+            arcs.append((entry, p, write_archive(p, entry)[1]))
+        msg = MIMEMultipart()
+        msg['From'] = formataddr(["考勤App", user])
+        msg['To'] = formataddr(["管理员", to_addr])
+        prefix = "【自动备份】" if is_auto else "【手动备份】"
+        label = "全量" if kind == "full" else "增量"
+        msg['Subject'] = f"{prefix} {date.today()} {label}数据"
+        arc_note = "".join(f"\n附 {y} 年归档 {an} 条（版本 {v}）。" for (y, _, v), _, an in arcs)
+        msg.attach(MIMEText(f"{label}备份，共 {n} 条记录，序号 {head['since']} -> {head['seq']}。{arc_note}\n恢复时先导入最近一次全量，再按日期依次导入之后的增量；归档附件可以和它们一起选。", 'plain', 'utf-8'))
+        _attach_file(msg, path, f"attendance_{head['date']}_{kind}_{head['seq']}.jsonl.gz")
+        for (y, _, v), p, _ in arcs: _attach_file(msg, p, f"attendance_archive_{y}_v{v}.jsonl.gz")
+        server = smtp or smtplib.SMTP_SSL(host, 465)
+        if smtp is None: server.login(user, pwd)
+        server.sendmail(user, [to_addr], msg.as_string())
+        if smtp is None: server.quit()
+        done = {"last_backup_seq": str(head["seq"]), **{f"archive_sent_{y}": str(v) for (y, _, v), _, _ in arcs}}
+        if is_auto: done["last_auto_date"] = head["date"]
+        if kind == "full":
+            done["last_full_date"] = head["date"]
+            # 全量之后，更早的变更记录不再需要
+            with storage.transaction() as c: c.execute("DELETE FROM changes WHERE seq <= ?", (head["seq"],))
+        storage.set_settings(done)
+        return True, "发送成功"
+    except Exception as ex: return False, str(ex)
+    finally:
+        for p in [path] + arc_paths: os.remove(p)
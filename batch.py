@@ -0,0 +1,108 @@
+import argparse
+from contextlib import contextmanager
+from datetime import date, timedelta
+import storage
+
+# --- 批量记工：改动先攒在内存里，预览无误后一个事务 executemany 写入，界面只刷新一次 ---
+# 界面的“批量记工”弹窗和命令行脚本共用这里；键是 (日期, 工人)，值是整行 (上午业主, 下午业主, 上午, 下午)。
+
+PERIODS = ("am", "pm")
+
+def _days(start, end):
+    d = start
+    while d <= end:
+        yield d; d += timedelta(days=1)
+
+class Batch:
+    def __init__(self):
+        self.changes = {}  # (日期, 工人) -> (ao, po, am, pm)
+        self._base = {}    # 日期 -> {工人: 库里现有的 (ao, po, am, pm)}，每个日期只查一次
+
+    def base(self, d_str):
+        if d_str not in self._base:
+            self._base[d_str] = {r[0]: r[1:] for r in storage.query(storage.over("SELECT worker_id, am_owner_id, pm_owner_id, am, pm FROM logs WHERE date=?", d_str, d_str), (d_str,))}
+        return self._base[d_str]
+
+    def current(self, d_str, wid):
+        """已攒的改动优先，其次库里的值，都没有就是空白"""
+        return self.changes.get((d_str, wid)) or self.base(d_str).get(wid) or (None, None, 0, 0)
+
+    @contextmanager
+    def _all_or_nothing(self):
+        """一次操作涉及多天、多个工人，中途有一天写不了（未来、已归档）就整体不改，已攒的改动和预览保持一致"""
+        saved = dict(self.changes)
+        try: yield
+        except: self.changes = saved; raise
+
+    def _set(self, d, wid, row):
+        if d > date.today(): raise ValueError("不能记录未来")
+        d_str = d.strftime("%Y-%m-%d")
+        if storage.is_archived(d_str): raise ValueError(f"{d.year} 年已归档，只能查看")
+        if row == tuple(self.base(d_str).get(wid) or (None, None, 0, 0)): self.changes.pop((d_str, wid), None)  # 改回原样就不用写
+        else: self.changes[(d_str, wid)] = row
+
+    def mark(self, d, wids, owner_id, periods=PERIODS, present=True):
+        """这些工人在这天的上午 / 下午记到某业主名下（present=False 则记为没来）"""
+        if owner_id is None: raise ValueError("先选业主！")
+        with self._all_or_nothing():
+            for wid in wids:
+                ao, po, am, pm = self.current(d.strftime("%Y-%m-%d"), wid)
+                if "am" in periods: ao, am = owner_id, int(present)
+                if "pm" in periods: po, pm = owner_id, int(present)
+                self._set(d, wid, (ao, po, am, pm))
+
+    def copy_day(self, src, dst, wids=None):
+        """把 src 那天的业主和出勤照搬到 dst；wids 为空就搬全部有记录的工人"""
+        rows = {wid: self.current(src.strftime("%Y-%m-%d"), wid) for wid in (wids or self.base(src.strftime("%Y-%m-%d")))}
+        with self._all_or_nothing():
+            for wid, row in rows.items():
+                if row[2] or row[3] or row[0] is not None or row[1] is not None: self._set(dst, wid, tuple(row))
+
+    def fill_range(self, start, end, wids, owner_id, periods=PERIODS, skip_sundays=False):
+        with self._all_or_nothing():
+            for d in _days(start, end):
+                if not (skip_sundays and d.weekday() == 6): self.mark(d, wids, owner_id, periods)
+
+    def preview(self):
+        """[(日期, 工人, 改前, 改后)]，按日期、工人排好"""
+        return [(d, wid, self.base(d).get(wid), row) for (d, wid), row in sorted(self.changes.items())]
+
+    def clear(self):
+        self.changes.clear(); self._base.clear()
+
+    def commit(self):
+        """一次写入全部改动，返回写入条数"""
+        rows = [(d, wid, *row) for (d, wid), row in sorted(self.changes.items())]
+        if rows: storage.set_attendance_many(rows)
+        self.clear()
+        return len(rows)
+
+if __name__ == "__main__":
+    # 脚本批量录入，例如：
+    #   python batch.py mark 2026-10-18 --owner 3 --workers 1 2 5 --periods am
+    #   python batch.py copy 2026-10-17 2026-10-18
+    #   python batch.py fill 2026-10-01 2026-10-15 --owner 3 --skip-sundays --dry-run
+    ap = argparse.ArgumentParser(description="批量记工")
+    ap.add_argument("action", choices=("mark", "copy", "fill"))
+    ap.add_argument("dates", nargs="+", type=date.fromisoformat)
+    ap.add_argument("--owner", type=int)
+    ap.add_argument("--workers", type=int, nargs="*", help="默认全部工人")
+    ap.add_argument("--periods", nargs="*", choices=PERIODS, default=list(PERIODS))
+    ap.add_argument("--skip-sundays", action="store_true")
+    ap.add_argument("--dry-run", action="store_true", help="只预览不写入")
+    ap.add_argument("--db")
+    a = ap.parse_args()
+    if a.action in ("copy", "fill") and len(a.dates) != 2: ap.error(f"{a.action} 要两个日期：" + ("源日期 目标日期" if a.action == "copy" else "开始日期 结束日期"))
+    if a.action in ("mark", "fill") and a.owner is None: ap.error(f"{a.action} 要用 --owner 指定业主")
+    storage.init(a.db)
+    wids = a.workers or [r[0] for r in storage.query("SELECT id FROM workers ORDER BY id")]
+    b = Batch()
+    try:
+        if a.action == "mark":
+            for d in a.dates: b.mark(d, wids, a.owner, a.periods)
+        elif a.action == "copy": b.copy_day(a.dates[0], a.dates[1], a.workers)
+        else: b.fill_range(a.dates[0], a.dates[1], wids, a.owner, a.periods, a.skip_sundays)
+    except ValueError as ex: storage.close(); ap.error(str(ex))
+    for d, wid, old, new in b.preview(): print(d, wid, old, "->", new)
+    print("预览", len(b.changes), "条" if a.dry_run else f"条，已写入 {b.commit()} 条")
+    storage.close()
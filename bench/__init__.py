@@ -0,0 +1,2 @@
+# 基准测试：gen 生成模拟考勤库，run 在无界面的假 Page 上跑真实界面代码并记录耗时 / 语句数 / 峰值内存
+# 用法：python -m bench.run --workers 30 --owners 10 --years 3 --out bench_results.json
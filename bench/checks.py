@@ -0,0 +1,243 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+import aggregates
+import backup
+import jobs
+import restore
+import storage
+from bench import gen
+from bench.stub import SMTP
+
+# --- 功能检查：在模拟库上走一遍容易回归的写入路径，不合格时退出码为 1 ---
+# 用法：python -m bench.checks
+
+def _toggle_existing(ctx):
+    # 先选业主再点上午 / 下午：第二条写入落在已有的行上，走 upsert 的 DO UPDATE，变更日志触发器也要跟着 upsert
+    d, wid = storage.one("SELECT date, worker_id FROM logs ORDER BY date DESC, worker_id LIMIT 1")
+    storage.set_owner(d, wid, "am", 1)
+    for am, pm in ((0, 1), (1, 0), (1, 1)):
+        storage.set_attendance(d, wid, 1, None, am, pm)
+        assert storage.one("SELECT am, pm FROM logs WHERE date=? AND worker_id=?", (d, wid)) == (am, pm), "记录没改过来"
+    seq = storage.one("SELECT n FROM change_seq")[0]
+    got = storage.query("SELECT seq FROM changes WHERE tbl='logs' AND k1=? AND k2=?", (d, wid))
+    assert got == [(seq,)], f"变更日志应只有一条序号 {seq} 的记录，实际 {got}"
+
+AGG_SQL = {  # 汇总表的当前内容，工钱取 6 位小数比较
+    "agg_worker": "SELECT kind, period, worker_id, n, half, round(money, 6) FROM agg_worker ORDER BY 1, 2, 3",
+    "agg_owner": "SELECT kind, period, owner_id, worker_id, half, round(money, 6) FROM agg_owner WHERE half <> 0 ORDER BY 1, 2, 3, 4",
+}
+_PERIODS = "SELECT 'solar' AS kind, substr(date, 1, 7) AS period, * FROM {src} UNION ALL SELECT 'lunar', c.lunar, x.* FROM {src} x JOIN cal_days c USING (date)"
+BRUTE_SQL = {  # 不靠触发器，直接从 logs 逐月 GROUP BY
+    "agg_worker": f'''WITH l AS ({_PERIODS.format(src="logs")})
+        SELECT l.kind, l.period, l.worker_id, COUNT(*), SUM((l.am <> 0) + (l.pm <> 0)), round(SUM((l.am <> 0) + (l.pm <> 0)) * 0.5 * COALESCE(w.daily_rate, 0), 6)
+        FROM l LEFT JOIN workers w ON w.id = l.worker_id GROUP BY 1, 2, 3 ORDER BY 1, 2, 3''',
+    "agg_owner": f'''WITH h AS (SELECT date, worker_id, am_owner_id AS owner_id FROM logs WHERE am <> 0 AND am_owner_id IS NOT NULL
+                         UNION ALL SELECT date, worker_id, pm_owner_id FROM logs WHERE pm <> 0 AND pm_owner_id IS NOT NULL),
+             l AS ({_PERIODS.format(src="h")})
+        SELECT l.kind, l.period, l.owner_id, l.worker_id, COUNT(*), round(COUNT(*) * 0.5 * COALESCE(w.daily_rate, 0), 6)
+        FROM l LEFT JOIN workers w ON w.id = l.worker_id GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4''',
+}
+
+def _aggregates(ctx):
+    # 随机增删改 logs、改日薪、删工人：触发器维护的汇总表要和全量重算、直接 GROUP BY 的结果一模一样
+    rnd, today = random.Random(3), date.today()
+    wids = [r[0] for r in storage.query("SELECT id FROM workers")]
+    oids = [r[0] for r in storage.query("SELECT id FROM owners")]
+    day = lambda: (today - timedelta(days=rnd.randint(0, 400))).strftime("%Y-%m-%d")
+    for _ in range(400):
+        op, d, wid, oid = rnd.random(), day(), rnd.choice(wids), rnd.choice(oids)
+        if op < 0.35: storage.set_attendance(d, wid, oid, rnd.choice(oids + [None]), rnd.randint(0, 1), rnd.randint(0, 1))
+        elif op < 0.55: storage.set_owner(d, wid, rnd.choice(("am", "pm")), oid)
+        elif op < 0.7: storage.set_attendance_many([(d, w, oid, rnd.choice(oids), 1, rnd.randint(0, 1)) for w in rnd.sample(wids, 3)])
+        elif op < 0.9: storage.execute("DELETE FROM logs WHERE worker_id=?1 AND date IN (SELECT date FROM logs WHERE worker_id=?1 ORDER BY date DESC LIMIT 2)", (wid,))
+        elif op < 0.98: storage.execute("UPDATE workers SET daily_rate=? WHERE id=?", (rnd.choice((150, 200, 260.5)), wid))
+        elif len(wids) > 3: storage.delete("workers", wid); wids.remove(wid)
+    got = {t: storage.query(sql) for t, sql in AGG_SQL.items()}
+    c = storage.conn()
+    c.execute("BEGIN")
+    try:
+        aggregates.rebuild(c)
+        rebuilt = {t: c.execute(sql).fetchall() for t, sql in AGG_SQL.items()}
+    finally: c.execute("ROLLBACK")
+    for t, sql in AGG_SQL.items():
+        assert got[t] == rebuilt[t], f"{t} 和全量重算不一致：{len(set(got[t]) ^ set(rebuilt[t]))} 行不同"
+        brute = storage.query(BRUTE_SQL[t])
+        assert got[t] == brute, f"{t} 和直接 GROUP BY 不一致：{len(set(got[t]) ^ set(brute))} 行不同"
+
+def _range_vs_monthly(ctx):
+    # 区间报表取整月（阳历月初到月底、农历初一到月末）应和月报逐行一样，包括只有记录没出工（0 天）的工人
+    import range_report
+    storage.add_worker("只记没出工", 180)
+    storage.set_attendance(storage.one("SELECT MAX(date) FROM logs")[0], storage.one("SELECT MAX(id) FROM workers")[0], None, None, 0, 0)  # 这个月只有一行上下午都没出工的记录
+    c = storage.conn()
+    for kind, period in storage.query("SELECT DISTINCT kind, period FROM agg_worker ORDER BY 1, 2 DESC")[::5]:
+        if kind == "solar":
+            s = date.fromisoformat(period + "-01")
+            e = (s + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        else: s, e = (date.fromisoformat(x) for x in storage.one("SELECT MIN(date), MAX(date) FROM cal_days WHERE lunar=?", (period,)))
+        for by, report in (("worker", aggregates.worker_report), ("owner", aggregates.owner_report)):
+            got = [(i, n, days, round(m, 6)) for i, n, p, days, m in range_report.rows(s, e, kind, by) if p == period]
+            want = [(i, n, days, round(m, 6)) for i, n, days, m in report(c, kind, period)]
+            assert got == want, f"{range_report.label(kind, period)} 按{by}：区间报表和月报不一致 {set(got) ^ set(want)}"
+
+def _snapshot():
+    return {**{t: storage.query(f"SELECT {', '.join(cols)} FROM {t} ORDER BY {', '.join(pk)}") for t, (cols, pk) in storage.TABLES.items()},
+            **{t: storage.query(sql) for t, sql in AGG_SQL.items()}}
+
+def _same(want, what):
+    got = _snapshot()
+    bad = [t for t in want if got[t] != want[t]]
+    assert not bad, f"{what}：{', '.join(bad)} 和备份前不一致"
+
+def _edit(rnd, n):
+    # 一批会进变更日志的改动：记工、换业主、删记录、改日薪、加 / 删工人
+    wids = [r[0] for r in storage.query("SELECT id FROM workers")]
+    day = lambda: (date.today() - timedelta(days=rnd.randint(0, 60))).strftime("%Y-%m-%d")
+    for _ in range(n):
+        op, wid = rnd.random(), rnd.choice(wids)
+        if op < 0.5: storage.set_attendance(day(), wid, 1, rnd.choice((2, None)), rnd.randint(0, 1), 1)
+        elif op < 0.7: storage.set_owner(day(), wid, "pm", 3)
+        elif op < 0.9: storage.execute("DELETE FROM logs WHERE worker_id=?1 AND date=(SELECT MAX(date) FROM logs WHERE worker_id=?1)", (wid,))
+        else: storage.execute("UPDATE workers SET daily_rate=daily_rate+10 WHERE id=?", (wid,))
+    storage.add_worker(f"新工人{rnd.randint(0, 999)}", 199.5)
+    storage.delete("workers", wids[-1])
+
+def _restore(ctx):
+    # 全量 + 两个增量（含删除墓碑）、旧版整段 JSON，覆盖 / 合并恢复后 logs、名单、汇总都和备份时一样；块切得很小时数字会被截断在块边界上
+    rnd, tmp = random.Random(6), tempfile.mkdtemp(prefix="restore_")
+    path = lambda name: os.path.join(tmp, name)
+    full, _ = backup.write_backup(path("full.gz"), "full")
+    base = _snapshot()
+    _edit(rnd, 60)
+    d1, _ = backup.write_backup(path("d1.gz"), "delta", full["seq"])
+    _edit(rnd, 60)
+    backup.write_backup(path("d2.gz"), "delta", d1["seq"])
+    want = _snapshot()
+    with open(path("legacy.json"), "w", encoding="utf-8") as f:
+        # 不认识的键整体跳过；顶层的裸数字最容易被块边界截断
+        json.dump({"version": 20240101, **{t: [list(r) for r in want[t]] for t in storage.TABLES}, "rate": 123456.75}, f, ensure_ascii=False)
+    chain = [path("d2.gz"), path("full.gz"), path("d1.gz")]  # 顺序打乱，按序号排
+    for chunk in (restore.CHUNK, 7):
+        old, restore.CHUNK = restore.CHUNK, chunk
+        try:
+            storage.set_attendance(date.today().strftime("%Y-%m-%d"), 1, 1, 1, 1, 0)
+            restore.restore(chain, "replace", batch_size=37); _same(want, f"全量 + 增量覆盖恢复（块 {chunk}）")
+            restore.restore([path("full.gz")], "replace"); _same(base, f"只恢复全量（块 {chunk}）")
+            restore.restore(chain[::2], "merge"); _same(want, f"全量之上合并两个增量（块 {chunk}）")
+            restore.restore([path("legacy.json")], "replace"); _same(want, f"旧版 JSON 覆盖恢复（块 {chunk}）")
+        finally: restore.CHUNK = old
+    # 合并：备份里没有的记录原样保留
+    extra = ((date.today() + timedelta(days=1)).strftime("%Y-%m-%d"), 1, 2, 2, 1, 1)
+    storage.set_attendance_many([extra])
+    restore.restore([path("legacy.json")], "merge")
+    assert storage.query("SELECT * FROM logs WHERE date=? AND worker_id=1", extra[:1]) == [extra], "合并恢复把备份里没有的记录删了"
+    storage.execute("DELETE FROM logs WHERE date=?", extra[:1])
+    _same(want, "合并恢复")
+    # 缺了中间的增量：整体拒绝，库不动
+    try: restore.restore([path("full.gz"), path("d2.gz")], "replace")
+    except ValueError as ex: assert "不连续" in str(ex), ex
+    else: raise AssertionError("缺少增量时应报错")
+    _same(want, "缺增量报错之后")
+
+def _rearchive(ctx):
+    # 归档 -> 取消归档 -> 暂停触发器改这一年（同覆盖恢复）-> 再归档：另一个线程的连接上还附加着第一次的归档库，
+    # 再归档的库名必须换新，那边读到的才是新文件而不是已删掉的旧文件
+    import archive
+    from concurrent.futures import ThreadPoolExecutor
+    year = storage.one("SELECT MIN(CAST(substr(date, 1, 4) AS INTEGER)) FROM logs")[0]
+    assert archive.closed(year), "模拟库里没有已结束的年份"
+    s, e = f"{year:04d}-01-01", f"{year:04d}-12-31"
+    sql = "SELECT COUNT(*), SUM(am + pm) FROM logs WHERE date BETWEEN ?1 AND ?2"
+    def read():  # 另一条连接：按区间附加归档库来查，顺便报出附加着的归档库名
+        c = storage.conn()
+        return c.execute(storage.over(sql, s, e, c), (s, e)).fetchone(), [r[1] for r in c.execute("PRAGMA database_list") if r[1].startswith("arc_")]
+    with ThreadPoolExecutor(1) as other:
+        archive.archive_year(year)
+        want, first = storage.one(storage.over(sql, s, e), (s, e)), other.submit(read).result()
+        assert first[0] == want, f"归档后另一条连接读到 {first[0]}，应为 {want}"
+        archive.unarchive(year)
+        storage.attach_archives()
+        c = storage.conn()
+        with storage.transaction(), storage.triggers_paused(c):
+            c.execute("DELETE FROM logs WHERE date BETWEEN ?1 AND ?2 AND worker_id=(SELECT MIN(worker_id) FROM logs WHERE date BETWEEN ?1 AND ?2)", (s, e))
+            aggregates.rebuild(c)
+        want = storage.one(sql, (s, e))
+        archive.archive_year(year)
+        got = other.submit(read).result()
+        assert got[1] != first[1], f"再归档沿用了库名 {first[1]}"
+        assert got[0] == want, f"再归档后另一条连接读到 {got[0]}，应为 {want}（还在读旧的归档文件）"
+        archive.unarchive(year)
+        other.submit(storage.close).result()
+
+def _queue(statuses, fail, timeout=10):
+    # 排一条手动备份，等后台队列把它发完或标成失败，返回状态回调收到的 [(成功, 提示)]
+    SMTP.sent, SMTP.connects, SMTP.fail = [], 0, fail
+    statuses.clear()
+    jobs.submit("manual")
+    end = time.time() + timeout
+    # 回调在改完 jobs 表之后才调用，要等到收到最终结果（不是“稍后重试”）为止
+    while storage.one("SELECT COUNT(*) FROM jobs WHERE state='pending'")[0] or not statuses or "后重试" in statuses[-1][1]:
+        if time.time() > end: raise TimeoutError("后台队列没在时限内处理完")
+        time.sleep(0.01)
+    return [ok for ok, _ in statuses]
+
+def _jobs_prep(ctx):
+    # 退避缩到毫秒级、三次就放弃，发信换成替身 SMTP
+    jobs.BACKOFF, jobs.MAX_ATTEMPTS = 0.01, 3
+    jobs.smtplib.SMTP_SSL = SMTP
+    ctx["statuses"] = []
+    jobs.start(lambda ok, text: ctx["statuses"].append((ok, text)), auto=False)
+
+def _job_retry(ctx):
+    # 替身 SMTP 前两次发送失败：每次失败都断开重连，第三次发出，任务从表里删掉
+    _jobs_prep(ctx)
+    storage.set_settings({"host": "smtp.check", "user": "a@check", "pass": "x", "to": "b@check"})
+    got = _queue(ctx["statuses"], 2)
+    assert (SMTP.connects, len(SMTP.sent)) == (3, 1), f"应连 3 次、发 1 封，实际连 {SMTP.connects} 次、发 {len(SMTP.sent)} 封"
+    assert got == [False, False, True], f"状态回调应为 失败, 失败, 成功，实际 {got}"
+    assert "秒后重试" in ctx["statuses"][0][1], ctx["statuses"][0][1]
+    assert not storage.query("SELECT * FROM jobs"), "发送成功后任务应从队列删除"
+
+def _job_give_up(ctx):
+    # 一直失败：用完 MAX_ATTEMPTS 次后标成 failed，只在最后报一次最终失败
+    got = _queue(ctx["statuses"], 10 ** 6)
+    assert got == [False] * jobs.MAX_ATTEMPTS and not SMTP.sent, f"应失败 {jobs.MAX_ATTEMPTS} 次，实际 {got}"
+    assert "后重试" not in ctx["statuses"][-1][1], ctx["statuses"][-1][1]
+    row = storage.one("SELECT state, attempts FROM jobs")
+    assert row == ("failed", jobs.MAX_ATTEMPTS), f"任务应为 failed / {jobs.MAX_ATTEMPTS}，实际 {row}"
+
+def _job_config(ctx):
+    # 邮箱没配好（ConfigError）不重试，直接标成失败；重新提交会清掉之前失败的任务
+    storage.execute("DELETE FROM settings WHERE key='pass'")
+    got = _queue(ctx["statuses"], 0)
+    assert got == [False] and SMTP.connects == 0, f"应不连邮箱直接失败一次，实际 {got}，连了 {SMTP.connects} 次"
+    assert storage.query("SELECT state FROM jobs") == [("failed",)], storage.query("SELECT state, attempts FROM jobs")
+
+CHECKS = [  # (名称, 函数)
+    ("已有记录上切换上午 / 下午", _toggle_existing),
+    ("汇总表·随机增删改后与重算一致", _aggregates),
+    ("备份恢复·全量 + 增量 / 旧版 JSON / 合并", _restore),
+    ("区间报表·整月和月报一致", _range_vs_monthly),
+    ("归档·取消再归档后别的连接读到新文件", _rearchive),
+    ("备份队列·失败重试后发出", _job_retry),
+    ("备份队列·重试用完标为失败", _job_give_up),
+    ("备份队列·邮箱未配置不重试", _job_config),
+]
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="checks_")
+    gen.generate(os.path.join(tmp, storage.DB_FILE), 10, 4, 1)
+    ctx, ok = {}, True
+    for name, f in CHECKS:
+        try: f(ctx); print(f"== {name} OK")
+        except Exception as ex: ok = False; print(f"== {name} 不合格: {type(ex).__name__}: {ex}")
+    storage.close()
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
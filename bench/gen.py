@@ -0,0 +1,56 @@
+import argparse
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+import aggregates
+import storage
+
+# --- 模拟数据：工人大多连续几天跟同一个业主，周日多数人休息，偶尔只来半天 ---
+
+def _days(years, end=None):
+    end = end or date.today()
+    d = end - timedelta(days=round(365.25 * years) - 1)
+    while d <= end:
+        yield d; d += timedelta(days=1)
+
+def _logs(workers, owners, years, rnd):
+    stick = {w: rnd.randint(1, owners) for w in range(1, workers + 1)}
+    for d in _days(years):
+        ds, rest = d.strftime("%Y-%m-%d"), d.weekday() == 6
+        for w in range(1, workers + 1):
+            if rnd.random() < 0.15: stick[w] = rnd.randint(1, owners)  # 换工地
+            if rnd.random() < (0.7 if rest else 0.1): continue  # 没来，不留记录
+            ao = stick[w]
+            po = ao if rnd.random() < 0.9 else rnd.randint(1, owners)
+            am, pm = (1, 1) if rnd.random() < 0.85 else rnd.choice(((1, 0), (0, 1), (0, 0)))
+            yield ds, w, ao, po, am, pm
+
+def generate(path, workers=30, owners=10, years=3, seed=1, force=False):
+    """生成一个模拟库，返回写入的记录数；文件已存在时要 force=True 才覆盖（别把真实的考勤库删了）"""
+    if os.path.exists(path) and not force: raise FileExistsError(f"{path} 已存在，确认要覆盖请加 --force")
+    for ext in ("", "-wal", "-shm"):
+        if os.path.exists(path + ext): os.remove(path + ext)
+    rnd = random.Random(seed)
+    storage.init(path)
+    with storage.transaction() as c, storage.triggers_paused(c):
+        c.executemany("INSERT INTO workers (id, name, daily_rate) VALUES (?,?,?)",
+                      [(i, f"工人{i:03d}", rnd.choice((150, 180, 200, 220, 250, 300, 350))) for i in range(1, workers + 1)])
+        c.executemany("INSERT INTO owners (id, name) VALUES (?,?)", [(i, f"业主{i:03d}") for i in range(1, owners + 1)])
+        c.executemany("INSERT INTO logs (date, worker_id, am_owner_id, pm_owner_id, am, pm) VALUES (?,?,?,?,?,?)", _logs(workers, owners, years, rnd))
+        aggregates.rebuild(c)
+    return storage.one("SELECT COUNT(*) FROM logs")[0]
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="生成模拟考勤库")
+    ap.add_argument("path", nargs="?", help="不给就生成在临时目录里")
+    ap.add_argument("--workers", type=int, default=30)
+    ap.add_argument("--owners", type=int, default=10)
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--force", action="store_true", help="覆盖已有的库文件")
+    a = ap.parse_args()
+    path = a.path or os.path.join(tempfile.mkdtemp(prefix="bench_"), storage.DB_FILE)
+    try: print(path, generate(path, a.workers, a.owners, a.years, a.seed, a.force), "条记录")
+    except FileExistsError as ex: ap.error(str(ex))
+    storage.close()
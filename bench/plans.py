@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import archive
+import range_report
+import storage
+from bench import gen
+
+# --- 查询计划检查：同一批热点查询在老结构（版本 0、无索引）和升级后的库上各 EXPLAIN 一次 ---
+# 升级后的计划里不许再出现对 logs 的全表扫描，也必须用上预期的索引；不满足时退出码为 1。
+# 用法：python -m bench.plans
+
+CHECKS = [  # (名称, 语句, 参数, 升级后计划里必须出现的索引)
+    ("明细·工人", storage.DRILL_WORKER_SQL, (1, "2026-01-01", "2026-01-31", "", 40), "logs_worker_cover"),
+    ("明细·业主", storage.DRILL_OWNER_SQL, (1, "2026-01-01", "2026-01-31", "", 0, 40), "logs_am_owner_cover"),
+    ("当天快照", storage.DAY_ALL_SQL, ("2026-01-01",), "PRIMARY KEY"),
+    ("单个工人当天", storage.DAY_ONE_SQL, ("2026-01-01", 1), "PRIMARY KEY"),
+    ("区间报表·工人·农历", range_report.sql("lunar", "worker"), ("2026-01-01", "2026-12-31"), "PRIMARY KEY"),
+    ("区间报表·业主·阳历", range_report.sql("solar", "owner"), ("2026-01-01", "2026-12-31"), "PRIMARY KEY"),
+    ("记录年份", "SELECT (SELECT MIN(date) FROM logs), (SELECT MAX(date) FROM logs)", (), "PRIMARY KEY"),
+]
+
+# 最早一年归档之后，跨归档年份的明细每一段都要走覆盖索引
+ARCHIVED_CHECKS = [  # (名称, 语句, 参数, 查询区间, 必须出现的索引)；{y} 是归档的年份
+    ("明细·工人·跨归档", storage.DRILL_WORKER_SQL, (1, "{y}-01-01", "{y1}-12-31", "", 40), ("{y}-01-01", "{y1}-12-31"), "logs_worker_cover"),
+    ("明细·业主·跨归档", storage.DRILL_OWNER_SQL, (1, "{y}-01-01", "{y1}-12-31", "", 0, 40), ("{y}-01-01", "{y1}-12-31"), "logs_am_owner_cover"),
+    ("当天快照·归档年", storage.DAY_ALL_SQL, ("{y}-12-01",), ("{y}-12-01", "{y}-12-01"), "PRIMARY KEY"),
+]
+
+def plan(c, sql, args):
+    return [r[-1] for r in c.execute("EXPLAIN QUERY PLAN " + sql, args)]
+
+def old_db(path):
+    # 版本 0 的结构：只有 storage.SCHEMA，没跑任何升级
+    c = sqlite3.connect(path)
+    for sql in storage.SCHEMA: c.execute(sql)
+    c.commit()
+    return c
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="plans_")
+    gen.generate(os.path.join(tmp, "new.db"), 10, 4, 1)
+    new, old, ok = storage.conn(), old_db(os.path.join(tmp, "old.db")), True
+    for name, sql, args, want in CHECKS:
+        after = plan(new, sql, args)
+        try: before = plan(old, sql, args)
+        except sqlite3.Error as ex: before = [f"({ex})"]
+        bad = [p for p in after if p.startswith("SCAN") and " logs" in p] or ([] if any(want in p for p in after) else [f"没用上 {want}"])
+        ok = ok and not bad
+        print(f"== {name} {'OK' if not bad else '不合格: ' + '; '.join(bad)}")
+        print("   升级前: " + " | ".join(before))
+        print("   升级后: " + " | ".join(after))
+    y = int(storage.one("SELECT MIN(date) FROM logs")[0][:4])
+    archive.archive_year(y)
+    fill = lambda xs: tuple(a.format(y=y, y1=y + 1) if isinstance(a, str) else a for a in xs)
+    for name, sql, args, span, want in ARCHIVED_CHECKS:
+        after = plan(new, storage.over(sql, *fill(span)), fill(args))
+        bad = [p for p in after if p.startswith("SCAN") and "logs" in p] or ([] if any(want in p for p in after) else [f"没用上 {want}"])
+        ok = ok and not bad
+        print(f"== {name} {'OK' if not bad else '不合格: ' + '; '.join(bad)}")
+        print("   计划: " + " | ".join(after))
+    old.close(); storage.close()
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import archive
+import backup
+import batch
+import jobs
+import main
+import range_report
+import profiler
+import report_cache
+import storage
+from bench import gen
+from bench.stub import Page, SMTP, count_controls
+
+# --- 基准测试：在假 Page 上跑真实的界面处理函数，每个场景记录耗时、SQL 语句数、峰值内存 ---
+# 每个场景先跑 repeat 次计时（不开 tracemalloc），再单独跑一次量峰值内存，避免内存跟踪拖慢计时。
+
+class Ctx:
+    def __init__(self, db):
+        self.db, self.page, self.h = db, None, None
+        self.tmp = tempfile.mkdtemp(prefix="bench_")
+        self.full_backup = os.path.join(self.tmp, "full.jsonl.gz")
+        self.phases = None  # 冷启动子进程报回来的分段耗时
+
+    def start(self):
+        self.page = Page()
+        self.h = main.build_app(self.page)
+
+def _report(lunar, mode):
+    def run(ctx):
+        ctx.h["state"].update(is_lunar_mode=lunar, report_month=datetime.now().date())
+        ctx.h["open_report_ui"](mode)
+    return run
+
+def _flip(ctx):
+    # 打开报表后连续往前翻 6 个月，每次之间给后台预取一点时间（人点按钮也要几百毫秒）
+    ctx.h["state"].update(is_lunar_mode=True, report_month=datetime.now().date())
+    ctx.h["open_report_ui"]("worker")
+    for _ in range(6):
+        time.sleep(0.05)
+        ctx.h["state"].update(report_month=ctx.h["state"]["report_month"] - timedelta(days=30))
+        ctx.h["open_report_ui"]("worker")
+
+def _cold(ctx): report_cache.clear()
+
+def _busiest(kind):
+    col = "worker_id" if kind == "worker" else "am_owner_id"
+    return storage.one(f"SELECT {col}, COUNT(*) FROM logs WHERE date >= date('now', '-60 days') GROUP BY 1 ORDER BY 2 DESC LIMIT 1")[0]
+
+def _drill(kind, all_pages):
+    def run(ctx):
+        ctx.h["state"].update(is_lunar_mode=True, report_month=datetime.now().date() - timedelta(days=20))  # 取一个完整的月
+        ctx.h["open_drill_down"](_busiest(kind), "bench", kind)
+        while all_pages:
+            n = ctx.page.updates; ctx.h["load_more_detail"]()
+            if ctx.page.updates == n: break
+    return run
+
+def _touch(ctx):
+    # 增量备份前先改几十条记录
+    d = datetime.now().strftime("%Y-%m-%d")
+    for wid, _, _, ao, po, am, pm, _, _ in storage.day_view(d)[:50]: storage.set_attendance(d, wid, ao or 1, po or 1, not am, pm)
+
+def _batch_week(ctx):
+    # 全体工人一周整天记到同一个业主，每次换一个业主保证真的有改动
+    ctx.flip = getattr(ctx, "flip", 0) + 1
+    b, end = batch.Batch(), datetime.now().date()
+    wids = [r[0] for r in storage.query("SELECT id FROM workers")]
+    b.fill_range(end - timedelta(days=6), end, wids, 1 + ctx.flip % 2)
+    b.commit(); ctx.h["refresh_ui"]()
+
+def _send(is_auto):
+    # 只量备份本身：生成附件 + 组邮件 + 交给（假的）SMTP
+    def run(ctx):
+        ok, msg = backup.send("smtp.bench", "a@bench", "x", "b@bench", is_auto, smtp=SMTP("smtp.bench"))
+        if not ok: raise RuntimeError(msg)
+    return run
+
+def _queue_prep(ctx):
+    storage.set_settings({"host": "smtp.bench", "user": "a@bench", "pass": "x", "to": "b@bench"})
+
+def _queue(ctx):
+    # 从提交到后台队列发完的耗时
+    jobs.submit("manual")
+    while storage.one("SELECT COUNT(*) FROM jobs WHERE state='pending'")[0]: time.sleep(0.002)
+
+def _prepare_restore(ctx):
+    backup.write_backup(ctx.full_backup, "full")
+    ctx.h["restore_state"]["paths"] = [ctx.full_backup]
+
+def _restore(ctx): ctx.h["do_import_data"](None)
+
+def _range_csv(lunar, by):
+    # 年底对账：库里全部年份按月拆开导出 CSV
+    def run(ctx):
+        lo, hi = storage.one("SELECT (SELECT MIN(date) FROM logs), (SELECT MAX(date) FROM logs)")
+        range_report.export_csv(os.path.join(ctx.tmp, "range.csv"), datetime.fromisoformat(lo).date(), datetime.fromisoformat(hi).date(), "lunar" if lunar else "solar", by)
+    return run
+
+# 归档场景放在最后：最早的一年搬进归档库 / 搬回，中间量跨归档年份的明细和导出
+def _oldest(): return int(storage.one("SELECT MIN(date) FROM logs")[0][:4])
+
+def _arc_year(): return min([y for y, _, _ in storage.archives()] or [_oldest()])
+
+def _ensure(archived):
+    def prep(ctx):
+        y = _arc_year()
+        if archived != storage.is_archived(f"{y}-01-01"): (archive.archive_year if archived else archive.unarchive)(y)
+    return prep
+
+def _drill_archived(ctx):
+    y = _arc_year()
+    storage.drill_worker(1, f"{y}-01-01", f"{y + 1}-12-31", None, 10 ** 6)
+
+def _range_archived(ctx):
+    y = _arc_year()
+    range_report.export_csv(os.path.join(ctx.tmp, "range.csv"), datetime(y, 1, 1).date(), datetime.now().date(), "lunar", "owner")
+
+# 冷启动：新开一个解释器从 import main 开始，导入、flet 控件模块加载都算在内；各阶段耗时取子进程里的 profiler.startup
+COLD = ("import sys, json, time; t = time.perf_counter(); import main, storage, profiler; from bench.stub import Page; "
+        "storage.init(sys.argv[1]); main.main(Page()); print(json.dumps({'wall_ms': (time.perf_counter() - t) * 1000, 'phases': profiler.startup}))")
+
+def _cold_start(ctx):
+    out = subprocess.run([sys.executable, "-c", COLD, ctx.db], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    ctx.phases = json.loads(out.stdout.strip().splitlines()[-1])["phases"]
+
+# 名称: (准备, 场景)；准备步骤不计入结果
+SCENARIOS = {
+    "cold_start": (None, _cold_start),
+    "startup": (None, lambda ctx: ctx.start()),
+    "refresh_ui": (None, lambda ctx: ctx.h["refresh_ui"]()),
+    "report_solar_worker": (_cold, _report(False, "worker")),
+    "report_solar_owner": (_cold, _report(False, "owner")),
+    "report_lunar_worker": (_cold, _report(True, "worker")),
+    "report_lunar_owner": (_cold, _report(True, "owner")),
+    "report_cached": (None, _report(True, "worker")),
+    "report_flip_months": (_cold, _flip),
+    "drill_worker": (None, _drill("worker", False)),
+    "drill_owner": (None, _drill("owner", False)),
+    "drill_owner_all_pages": (None, _drill("owner", True)),
+    "range_csv_solar_worker": (None, _range_csv(False, "worker")),
+    "range_csv_lunar_owner": (None, _range_csv(True, "owner")),
+    "batch_fill_week": (None, _batch_week),
+    "backup_full": (None, _send(False)),
+    "backup_delta": (_touch, _send(True)),
+    "backup_queue": (_queue_prep, _queue),
+    "restore_replace": (_prepare_restore, _restore),
+    "archive_year": (_ensure(False), lambda ctx: archive.archive_year(_arc_year())),
+    "drill_worker_archived": (_ensure(True), _drill_archived),
+    "range_csv_archived": (_ensure(True), _range_archived),
+    "unarchive_year": (_ensure(True), lambda ctx: archive.unarchive(_arc_year())),
+}
+
+def measure(ctx, name, repeat):
+    prep, run = SCENARIOS[name]
+    walls, statements, ctx.phases = [], 0, None
+    for i in range(repeat + 1):
+        if prep: prep(ctx)
+        memory = i == repeat
+        if memory: tracemalloc.start()
+        n, page, updates = profiler.counts["statements"], ctx.page, ctx.page.updates
+        t = time.perf_counter()
+        run(ctx)
+        wall = time.perf_counter() - t
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+        else: walls.append(wall); statements = profiler.counts["statements"] - n
+    return {"wall_ms_min": round(min(walls) * 1000, 2), "wall_ms_median": round(statistics.median(walls) * 1000, 2),
+            "statements": statements, "page_updates": ctx.page.updates - (updates if ctx.page is page else 0), "controls": count_controls(ctx.page),
+            "peak_kb": round(peak / 1024, 1), **({"phases_ms": {k: round(v, 2) for k, v in (ctx.phases or profiler.startup).items()}} if name in ("startup", "cold_start") else {})}
+
+def run(db, repeat=5, only=None):
+    ctx = Ctx(db)
+    storage.factory = profiler.Connection  # 只数语句，不开记录
+    storage.init(db)  # main.init_db() 之后沿用这个路径
+    backup.smtplib.SMTP_SSL = SMTP  # 不真的发邮件
+    ctx.start()
+    results = {}
+    try:
+        for name in SCENARIOS:
+            if only and name not in only: continue
+            results[name] = measure(ctx, name, repeat)
+            print(f"{name:24s} {results[name]['wall_ms_median']:>10.2f} ms {results[name]['statements']:>7d} 条语句 {results[name]['peak_kb']:>10.1f} KB")
+    finally:
+        storage.factory = sqlite3.Connection; storage.close()
+    return results
+
+def _copy(src, dst):
+    s, d = sqlite3.connect(src), sqlite3.connect(dst)
+    try: s.backup(d)  # 在线备份，WAL 里没合并的页也一起带上
+    finally: s.close(); d.close()
+
+def copy_db(src):
+    """把给定的库（连同登记的归档库）拷到临时目录：场景会改数据、做恢复和归档，不能动原文件"""
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    dst = os.path.join(tmp, os.path.basename(src))
+    _copy(src, dst)
+    c = sqlite3.connect(dst)
+    try: files = [r[0] for r in c.execute("SELECT file FROM archives")] if c.execute("SELECT 1 FROM sqlite_master WHERE name='archives'").fetchone() else []
+    finally: c.close()
+    for f in files: _copy(os.path.join(os.path.dirname(os.path.abspath(src)), f), os.path.join(tmp, f))
+    return dst
+
+def compare(old, new):
+    for name, r in new.items():
+        o = old.get(name)
+        if not o: continue
+        ratio = r["wall_ms_median"] / o["wall_ms_median"] if o["wall_ms_median"] else float("inf")
+        print(f"{name:24s} 耗时 x{ratio:.2f}  语句 {o['statements']} -> {r['statements']}  内存 {o['peak_kb']} -> {r['peak_kb']} KB")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="考勤 App 无界面基准测试")
+    ap.add_argument("--db", help="已有的库（先拷到临时目录再测，原文件不动）；不给就按下面的规模新生成一个临时库")
+    ap.add_argument("--workers", type=int, default=30)
+    ap.add_argument("--owners", type=int, default=10)
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", nargs="*", help="只跑这些场景")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="上一次的结果文件，逐项对比")
+    a = ap.parse_args()
+    db = copy_db(a.db) if a.db else os.path.join(tempfile.mkdtemp(prefix="bench_"), storage.DB_FILE)
+    if not a.db:
+        print("生成模拟库:", db, gen.generate(db, a.workers, a.owners, a.years, a.seed), "条记录"); storage.close()
+    results = run(db, a.repeat, a.only)
+    meta = {"time": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "db": db, "repeat": a.repeat, **{t: storage.one(f"SELECT COUNT(*) FROM {t}")[0] for t in storage.TABLES}}
+    storage.close()
+    with open(a.out, "w", encoding="utf-8") as f: json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=1)
+    print("结果已写入", a.out)
+    if a.compare:
+        with open(a.compare, encoding="utf-8") as f: compare(json.load(f)["results"], results)
@@ -0,0 +1,27 @@
+import profiler
+
+# --- 无界面替身：界面代码照常构建控件，只是不连 Flutter ---
+
+class Page:
+    """假的 ft.Page：记下 update 次数，run_thread 在当前线程同步执行"""
+    def __init__(self):
+        self.overlay, self.controls, self.services, self.updates = [], [], [], 0
+
+    def update(self, *controls): self.updates += 1
+    def add(self, *controls): self.controls.extend(controls)
+    def run_thread(self, handler, *args): handler(*args)
+
+class SMTP:
+    """替代 smtplib.SMTP_SSL，只记录发出的邮件大小；fail 设为 n 时前 n 次发送失败（测重试）"""
+    sent, connects, fail = [], 0, 0
+    def __init__(self, host, port=0, *args, **kwargs): self.host = host; SMTP.connects += 1
+    def login(self, user, pwd): pass
+    def noop(self): return (250, b"OK")
+    def sendmail(self, from_addr, to_addrs, msg):
+        if SMTP.fail > 0: SMTP.fail -= 1; raise OSError("模拟发送失败")
+        SMTP.sent.append(len(msg))
+    def quit(self): pass
+
+def count_controls(page):
+    """页面和全部 overlay（含未打开的弹窗）里的控件数"""
+    return sum(len(profiler.walk(c)) for c in page.controls + page.overlay)
@@ -0,0 +1,127 @@
+import smtplib
+import threading
+import time
+from datetime import date
+import backup
+import profiler
+import storage
+
+# --- 后台备份队列：一个工作线程按 jobs 表顺序执行，失败按指数退避重试 ---
+# 任务存在库里，App 被杀掉后下次启动接着发；同一种任务排队中只保留一条（jobs_pending 唯一索引）。
+# 连续发送时复用同一条 SMTP 连接，队列空了再断开。结果通过 start() 传入的回调报给界面（在工作线程里调用）。
+
+KINDS = ("auto", "manual")
+MAX_ATTEMPTS = 6
+BACKOFF = 30         # 第 n 次失败后等 BACKOFF * 2^(n-1) 秒
+BACKOFF_MAX = 3600
+
+_wake, _check = threading.Event(), threading.Event()
+_thread = None
+_on_status = None
+_smtp = {}  # (host, user) -> 已登录的连接，只在工作线程里用
+
+class ConfigError(Exception):
+    """邮箱没配好，重试也没用"""
+
+def _status(ok, text):
+    if _on_status:
+        try: _on_status(ok, text)
+        except Exception: pass
+
+def submit(kind):
+    """排一条任务；同种任务已在排队就合并，返回 False"""
+    if kind not in KINDS: raise ValueError(f"未知任务: {kind}")
+    with storage.transaction() as c:
+        c.execute("DELETE FROM jobs WHERE kind=? AND state='failed'", (kind,))
+        added = c.execute("INSERT OR IGNORE INTO jobs (kind, next_at, created) VALUES (?,?,?)", (kind, time.time(), date.today().strftime("%Y-%m-%d"))).rowcount
+    _wake.set()
+    return bool(added)
+
+def check_auto():
+    """让工作线程看一下今天的自动备份发了没有（设置查询也在工作线程里做）"""
+    _check.set(); _wake.set()
+
+def pending():
+    return storage.query("SELECT kind, state, attempts, next_at, last_error FROM jobs ORDER BY id")
+
+def _settings():
+    s = {k: storage.get_setting(k) for k in ("host", "user", "pass", "to")}
+    if not all(s.values()): raise ConfigError("请先配置邮箱！")
+    return s
+
+def _auto_due():
+    if storage.get_setting("auto_backup") != "1": return
+    if storage.get_setting("last_auto_date") == date.today().strftime("%Y-%m-%d"): return
+    try: _settings()
+    except ConfigError: return
+    submit("auto")
+
+def _server(host, user, pwd):
+    key = (host, user)
+    s = _smtp.get(key)
+    if s is not None:
+        try: s.noop(); return s
+        except Exception: _drop_smtp(key)
+    s = smtplib.SMTP_SSL(host, 465)
+    s.login(user, pwd)
+    _smtp[key] = s
+    return s
+
+def _drop_smtp(key=None):
+    for k in ([key] if key else list(_smtp)):
+        s = _smtp.pop(k, None)
+        if s is None: continue
+        try: s.quit()
+        except Exception: pass
+
+@profiler.timed("backup")
+def run(kind):
+    """执行一条备份任务，返回 (是否成功, 提示)；配置错误抛 ConfigError"""
+    is_auto = kind == "auto"
+    if is_auto and storage.get_setting("last_auto_date") == date.today().strftime("%Y-%m-%d"): return True, "今天已自动备份"
+    s = _settings()
+    try: server = _server(s["host"], s["user"], s["pass"])
+    except Exception as ex: return False, f"连接邮箱失败: {ex}"
+    ok, msg = backup.send(s["host"], s["user"], s["pass"], s["to"], is_auto, smtp=server)
+    if not ok: _drop_smtp((s["host"], s["user"]))  # 连接可能已坏，下次重连
+    return ok, msg
+
+def _step(job_id, kind, attempts):
+    label = "自动备份" if kind == "auto" else "备份邮件"
+    try: ok, msg = run(kind)
+    except ConfigError as ex: ok, msg, attempts = False, str(ex), MAX_ATTEMPTS - 1
+    except Exception as ex: ok, msg = False, str(ex)
+    if ok:
+        storage.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+        _status(True, f"{label}：{msg}"); return
+    attempts += 1
+    if attempts >= MAX_ATTEMPTS:
+        storage.execute("UPDATE jobs SET state='failed', attempts=?, last_error=? WHERE id=?", (attempts, msg, job_id))
+        _status(False, f"{label}失败：{msg}"); return
+    delay = min(BACKOFF * 2 ** (attempts - 1), BACKOFF_MAX)
+    storage.execute("UPDATE jobs SET attempts=?, next_at=?, last_error=? WHERE id=?", (attempts, time.time() + delay, msg, job_id))
+    _status(False, f"{label}失败，{delay} 秒后重试：{msg}")
+
+def _loop():
+    while True:
+        try:
+            if _check.is_set(): _check.clear(); _auto_due()
+            job = storage.one("SELECT id, kind, attempts FROM jobs WHERE state='pending' AND next_at<=? ORDER BY next_at, id LIMIT 1", (time.time(),))
+            if job: _step(*job); continue
+            nxt = storage.one("SELECT MIN(next_at) FROM jobs WHERE state='pending'")[0]
+        except Exception as ex:
+            _status(False, f"后台任务出错：{ex}"); nxt = time.time() + BACKOFF
+        # 空闲时断开 SMTP 和数据库连接，醒来再按当前库文件重连
+        _drop_smtp(); storage.close()
+        _wake.wait(None if nxt is None else max(0.0, nxt - time.time()))
+        _wake.clear()
+
+def start(on_status=None, auto=True):
+    """启动工作线程（只起一个）；auto=True 时顺便检查今天的自动备份。不阻塞调用方"""
+    global _thread, _on_status
+    _on_status = on_status
+    if auto: _check.set()
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_loop, name="backup-jobs", daemon=True)
+        _thread.start()
+    _wake.set()
@@ -0,0 +1,61 @@
+from array import array
+from datetime import timedelta
+from zhdate import ZhDate
+
+# --- 农历索引：按年份一次性构建，阳历日期 -> 农历 O(1) 查表 ---
+# 只在构建时调用 ZhDate（每个农历月一次），之后的换算全部查数组，不再逐行调用 ZhDate。
+class LunarIndex:
+    def __init__(self):
+        self.years = None      # 已覆盖的阳历年份 (起, 止)
+        self.first = None      # 数组第 0 格对应的阳历日期
+        self.months = []       # [(阳历首日, 农历年, 农历月, 是否闰月)]，按时间排序
+        self.day_map = array("H")  # 每一天属于 months 中的第几个月
+        self.texts = {}
+
+    def _build(self, y0, y1):
+        months = []
+        for ly in range(y0 - 1, y1 + 1):  # 农历年跨到次年春节，往前多取一年才能盖住元旦
+            for lm in range(1, 13):
+                for leap in (False, True):
+                    try: start = ZhDate(ly, lm, 1, leap).to_datetime().date()
+                    except TypeError: continue  # 该年没有这个闰月 / 超出 1900-2100
+                    months.append((start, ly, lm, leap))
+        if len(months) < 2: raise ValueError(f"农历表不支持 {y0}-{y1} 年")
+        months.sort()
+        day_map = array("H")
+        for i in range(len(months) - 1):  # 最后一个月只用作结束边界
+            day_map.extend([i] * (months[i + 1][0] - months[i][0]).days)
+        self.years, self.first, self.months, self.day_map = (y0, y1), months[0][0], months, day_map
+
+    def _locate(self, d):
+        off = -1 if self.first is None else (d - self.first).days
+        if not 0 <= off < len(self.day_map):
+            y0, y1 = self.years or (d.year, d.year)
+            self._build(min(y0, d.year - 1), max(y1, d.year + 1))
+            off = (d - self.first).days
+        i = self.day_map[off]
+        return i, off
+
+    def lunar_of(self, d):
+        """返回 (农历年, 农历月, 农历日, 是否闰月)"""
+        i, off = self._locate(d)
+        start, ly, lm, leap = self.months[i]
+        return ly, lm, off - (start - self.first).days + 1, leap
+
+    def month_range(self, d):
+        """返回 d 所在农历月的 (阳历首日, 阳历末日)"""
+        i, _ = self._locate(d)
+        return self.months[i][0], self.months[i + 1][0] - timedelta(days=1)
+
+    def lunar_text(self, d):
+        """与 ZhDate.chinese() 去掉年份后的文字一致，例如 “正月初一 甲辰年 (龙年)”"""
+        key = self.lunar_of(d)
+        if key not in self.texts:
+            full = ZhDate(key[0], key[1], key[2], key[3]).chinese()
+            self.texts[key] = full[full.find("年")+1:]
+        return self.texts[key]
+
+_index = LunarIndex()
+lunar_of = _index.lunar_of
+month_range = _index.month_range
+lunar_text = _index.lunar_text
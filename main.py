@@ -1,27 +1,23 @@
+import time
+_t0 = time.perf_counter()
 import flet as ft
-import sqlite3
-import json
-import smtplib
-import threading
-from email.mime.text import MIMEText
-from email.utils import formataddr
-from datetime import date, datetime, timedelta
-from zhdate import ZhDate
+import os
+from datetime import date, timedelta
+import aggregates
+import storage
+import profiler
+import report_cache
+# 邮件 / JSON / 农历 / 恢复 / 批量记工 / 区间报表相关的模块都在第一次用到时才导入，见各函数里的 import
 
 # --- 1. 数据库初始化 ---
 def init_db():
-    conn = sqlite3.connect("attendance_pro_v230_named.db", check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS workers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, daily_rate REAL)')
-    cursor.execute('CREATE TABLE IF NOT EXISTS owners (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT)')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS logs 
-                      (date TEXT, worker_id INTEGER, am_owner_id INTEGER, pm_owner_id INTEGER, 
-                       am INTEGER, pm INTEGER, PRIMARY KEY (date, worker_id))''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
-    conn.commit()
-    return conn
+    storage.init()
 
-def main(page: ft.Page):
+def build_app(page: ft.Page):
+    """在 page 上搭好整个界面，返回几个处理函数（bench 无界面驱动用）"""
+    # 启动分段计时：进入 main 前（导入）、建库、首屏、首屏之后的收尾，记到 profiler.startup
+    global _t0
+    phases, _t0 = profiler.Phases(_t0), None  # 导入耗时只算第一次
     # --- 基础配置 ---
     page.title = "极简考勤"
     page.theme_mode = ft.ThemeMode.LIGHT
@@ -29,8 +25,9 @@ def main(page: ft.Page):
     page.scroll = ft.ScrollMode.AUTO
     page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
 
-    db_conn = init_db()
-    cursor = db_conn.cursor()
+    init_db()
+    if profiler.wanted(storage.get_setting("profile")): profiler.enable(page)
+    phases.mark("init_db")
     
     state = {
         "view_date": date.today(), 
@@ -49,30 +46,30 @@ def main(page: ft.Page):
     btn_next = ft.IconButton(ft.Icons.ARROW_FORWARD, icon_size=30)
     col_records = ft.Column(spacing=15)
     
-    col_manage = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=400)
-    col_report = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=400)
-    col_detail = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=450)
-    col_owners = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=400)
-    
-    in_name = ft.TextField(label="名称")
-    in_rate = ft.TextField(label="日薪", keyboard_type="number")
-    in_import = ft.TextField(label="数据区", multiline=True, min_lines=8, max_lines=12, text_size=14)
-    
-    mail_server = ft.Dropdown(
-        label="邮箱类型", 
-        options=[
-            ft.dropdown.Option("smtp.qq.com", "QQ邮箱"),
-            ft.dropdown.Option("smtp.163.com", "163邮箱"),
-            ft.dropdown.Option("other", "其他(自定义)"),
-        ],
-        value="smtp.qq.com"
-    )
-    mail_user = ft.TextField(label="你的邮箱账号")
-    mail_pass = ft.TextField(label="授权码 (非密码)", password=True, can_reveal_password=True)
-    mail_to = ft.TextField(label="接收备份的邮箱")
-    switch_auto_backup = ft.Switch(label="每天启动自动备份", value=False)
-    
-    txt_confirm_msg = ft.Text("", size=18, weight="bold") # 加大字号
+
+    # 弹窗和里面的控件第一次打开时才构建并挂到 overlay（flet 的控件模块也是用到才导入），首屏只建日视图
+    add_dlg = in_name = in_rate = None
+    manage_dlg = col_manage = None
+    report_dlg = col_report = None
+    detail_dlg = col_detail = btn_detail_more = None
+    picker_dlg = col_owners = None
+    import_dlg = in_import = None
+    safe_dlg = txt_confirm_msg = None
+    email_dlg = mail_server = mail_user = mail_pass = mail_to = switch_auto_backup = None
+    file_picker = None
+    restore_dlg = txt_restore_files = in_restore_text = radio_restore_mode = bar_restore = txt_restore_status = btn_restore_go = None
+    restore_state = {"paths": []}
+    batch_dlg = pending = dd_batch_owner = chk_batch_am = chk_batch_pm = chk_batch_all = col_batch_workers = None
+    in_batch_from = in_batch_to = chk_batch_sunday = lv_batch_preview = txt_batch_count = btn_batch_save = None
+    batch_names = {"workers": {}, "owners": {}}
+    diag_dlg = switch_profile = in_diag = None
+    archive_dlg = col_archive = None
+    range_dlg = dd_range_preset = in_range_from = in_range_to = radio_range_by = lv_range = txt_range_status = btn_range_export = None
+    built = set()
+
+    def need(build):
+        if build not in built:
+            built.add(build); page.overlay.append(build())
 
     # --- 3. 稳健的辅助函数 ---
     def close_dlg(dlg):
@@ -84,8 +81,42 @@ def main(page: ft.Page):
         page.snack_bar.open = True
         page.update()
 
+    def picker():
+        nonlocal file_picker
+        if file_picker is None:
+            file_picker = ft.FilePicker()
+            page.services.append(file_picker)
+        return file_picker
+
+    # 导出的文件由用户选保存位置：手机上 App 的工作目录是私有的，用户打不开。
+    # 桌面上直接写到选好的路径；手机 / 网页上 save_file 只收文件内容，先写到临时文件再整个交过去
+    async def save_as(title, name, write):
+        """write(路径) 在后台线程里写文件；返回 (保存到哪, write 的返回值)，用户取消返回 None"""
+        import asyncio
+        def work(path):
+            try: return write(path)
+            finally: storage.close()
+        if page.web or page.platform.is_mobile():
+            import tempfile
+            fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(name)[1]); os.close(fd)
+            try:
+                res = await asyncio.to_thread(work, tmp)
+                with open(tmp, "rb") as f: data = f.read()
+                where = await picker().save_file(dialog_title=title, file_name=name, src_bytes=data)
+                return (where, res) if where else None
+            finally: os.remove(tmp)
+        path = await picker().save_file(dialog_title=title, file_name=name)
+        return (path, await asyncio.to_thread(work, path)) if path else None
+
     # --- 核心：确认弹窗逻辑 ---
+    def build_confirm():
+        nonlocal safe_dlg, txt_confirm_msg
+        txt_confirm_msg = ft.Text("", size=18, weight="bold") # 加大字号
+        safe_dlg = ft.AlertDialog(title=ft.Text("确认操作"), content=txt_confirm_msg)
+        return safe_dlg
+
     def ask_confirm(message, on_yes_func):
+        need(build_confirm)
         txt_confirm_msg.value = message
         def on_yes_click(e):
             on_yes_func() 
@@ -99,105 +130,119 @@ def main(page: ft.Page):
         page.update()
 
     def get_lunar_text(d_obj):
-        try:
-            zd = ZhDate.from_datetime(datetime(d_obj.year, d_obj.month, d_obj.day))
-            full = zd.chinese()
-            return full[full.find("年")+1:]
+        import lunar_calendar
+        try: return lunar_calendar.lunar_text(d_obj)
         except: return "农历日期"
 
     # --- 4. 邮件逻辑 ---
-    def _send_mail_task(host, user, pwd, to_addr, is_auto=False):
-        try:
-            local_conn = sqlite3.connect("attendance_pro_v230_named.db")
-            local_cur = local_conn.cursor()
-            data = {
-                'workers': local_cur.execute('SELECT * FROM workers').fetchall(),
-                'owners': local_cur.execute('SELECT * FROM owners').fetchall(),
-                'logs': local_cur.execute('SELECT * FROM logs').fetchall()
-            }
-            json_str = json.dumps(data, ensure_ascii=False, indent=2)
-            msg = MIMEText(json_str, 'plain', 'utf-8')
-            msg['From'] = formataddr(["考勤App", user])
-            msg['To'] = formataddr(["管理员", to_addr])
-            prefix = "【自动备份】" if is_auto else "【手动备份】"
-            msg['Subject'] = f"{prefix} {date.today()} 数据"
-            server = smtplib.SMTP_SSL(host, 465)
-            server.login(user, pwd)
-            server.sendmail(user, [to_addr], msg.as_string())
-            server.quit()
-            if is_auto:
-                local_cur.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("last_auto_date", date.today().strftime("%Y-%m-%d")))
-                local_conn.commit()
-            local_conn.close()
-            return True, "发送成功"
-        except Exception as ex: return False, str(ex)
+    # 备份都交给 jobs 的后台队列：失败自动重试，结果回调到这里弹提示
+    def on_backup_status(ok, text):
+        show_toast(text, not ok)
+
+    def build_email():
+        nonlocal email_dlg, mail_server, mail_user, mail_pass, mail_to, switch_auto_backup
+        mail_server = ft.Dropdown(
+            label="邮箱类型", 
+            options=[
+                ft.dropdown.Option("smtp.qq.com", "QQ邮箱"),
+                ft.dropdown.Option("smtp.163.com", "163邮箱"),
+                ft.dropdown.Option("other", "其他(自定义)"),
+            ],
+            value="smtp.qq.com"
+        )
+        mail_user = ft.TextField(label="你的邮箱账号")
+        mail_pass = ft.TextField(label="授权码 (非密码)", password=True, can_reveal_password=True)
+        mail_to = ft.TextField(label="接收备份的邮箱")
+        switch_auto_backup = ft.Switch(label="每天启动自动备份", value=False)
+        email_dlg = ft.AlertDialog(title=ft.Text("邮箱配置"), content=ft.Column([ft.Text("需SMTP服务+授权码", size=12, color="grey"), mail_server, mail_user, mail_pass, mail_to, ft.Divider(), switch_auto_backup], tight=True, width=300), actions=[ft.TextButton("取消", on_click=lambda _: close_dlg(email_dlg)), ft.FilledButton("保存", on_click=save_mail_settings)])
+        return email_dlg
 
     def load_email_settings():
+        need(build_email)
         for k, ctrl in [("host", mail_server), ("user", mail_user), ("pass", mail_pass), ("to", mail_to)]:
-            cursor.execute("SELECT value FROM settings WHERE key=?", (k,))
-            res = cursor.fetchone()
-            if res: ctrl.value = res[0]
-        cursor.execute("SELECT value FROM settings WHERE key='auto_backup'")
-        res = cursor.fetchone()
-        switch_auto_backup.value = (res[0] == "1") if res else False
+            v = storage.get_setting(k)
+            if v is not None: ctrl.value = v
+        switch_auto_backup.value = storage.get_setting("auto_backup") == "1"
 
     def save_mail_settings(e):
         try:
-            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("host", mail_server.value))
-            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("user", mail_user.value))
-            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("pass", mail_pass.value))
-            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("to", mail_to.value))
-            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("auto_backup", "1" if switch_auto_backup.value else "0"))
-            db_conn.commit()
+            storage.set_settings({"host": mail_server.value, "user": mail_user.value, "pass": mail_pass.value, "to": mail_to.value,
+                                  "auto_backup": "1" if switch_auto_backup.value else "0"})
             close_dlg(email_dlg)
             show_toast("设置保存成功")
-            if switch_auto_backup.value: check_and_run_auto_backup()
+            if switch_auto_backup.value:
+                import jobs
+                jobs.check_auto()
         except Exception as ex: show_toast(f"保存失败: {ex}", True)
 
     def send_backup_email_manual(e):
         load_email_settings()
         if not (mail_user.value and mail_pass.value and mail_to.value):
             show_toast("请先配置邮箱！", True); email_dlg.open = True; page.update(); return
-        show_toast("正在后台发送...", False)
-        threading.Thread(target=lambda: _send_mail_task(mail_server.value, mail_user.value, mail_pass.value, mail_to.value), daemon=True).start()
-
-    def check_and_run_auto_backup():
-        cursor.execute("SELECT value FROM settings WHERE key='auto_backup'")
-        res = cursor.fetchone()
-        if not res or res[0] != "1": return
-        cursor.execute("SELECT value FROM settings WHERE key='last_auto_date'")
-        last = cursor.fetchone()
-        if last and last[0] == date.today().strftime("%Y-%m-%d"): return 
-        settings = {}
-        for k in ['host', 'user', 'pass', 'to']:
-            cursor.execute("SELECT value FROM settings WHERE key=?", (k,))
-            r = cursor.fetchone()
-            if r: settings[k] = r[0]
-        if len(settings) == 4:
-            threading.Thread(target=lambda: _send_mail_task(settings['host'], settings['user'], settings['pass'], settings['to'], True), daemon=True).start()
+        import jobs
+        show_toast("正在后台发送..." if jobs.submit("manual") else "已在发送队列中", False)
 
     # --- 5. 备份与恢复 ---
+    # 恢复：从文件分块读取（邮件里的 .gz 附件或旧版 JSON 文本），粘贴只作为小数据的备用入口
+    def build_restore():
+        nonlocal restore_dlg, txt_restore_files, in_restore_text, radio_restore_mode, bar_restore, txt_restore_status, btn_restore_go
+        txt_restore_files = ft.Text("未选择文件", size=14)
+        in_restore_text = ft.TextField(label="或长按 -> 粘贴备份文本", multiline=True, min_lines=2, max_lines=4, text_size=14)
+        radio_restore_mode = ft.RadioGroup(content=ft.Row([ft.Radio(value="replace", label="覆盖全部"), ft.Radio(value="merge", label="合并")]), value="replace")
+        bar_restore = ft.ProgressBar(value=0, visible=False)
+        txt_restore_status = ft.Text("", size=14)
+        btn_restore_go = ft.FilledButton("开始恢复", on_click=do_import_data)
+        restore_dlg = ft.AlertDialog(title=ft.Text("恢复数据"), content=ft.Column([ft.TextButton("选择备份文件 >", on_click=pick_restore_files), txt_restore_files, in_restore_text, ft.Text("覆盖：清空后写入；合并：同一天同一工人以备份为准，其余保留", size=12, color="grey"), radio_restore_mode, bar_restore, txt_restore_status], tight=True, width=300), actions=[ft.TextButton("取消", on_click=lambda _: close_dlg(restore_dlg)), btn_restore_go])
+        return restore_dlg
+
     def do_import_data(e):
-        try:
-            raw = in_import.value
-            if not raw or not raw.strip(): show_toast("无内容", True); return
-            try: data = json.loads(raw)
-            except: show_toast("格式错误", True); return
-            if not isinstance(data, dict): show_toast("数据错乱", True); return
-            cursor.execute("BEGIN TRANSACTION")
+        import tempfile
+        import restore
+        need(build_restore)
+        paths, tmp = list(restore_state["paths"]), None
+        if not paths:
+            raw = in_restore_text.value
+            if not raw or not raw.strip(): show_toast("请选择备份文件或粘贴内容", True); return
+            fd, tmp = tempfile.mkstemp(suffix=".json")  # 粘贴的文本也走同一个分块恢复引擎
+            with os.fdopen(fd, "w", encoding="utf-8") as f: f.write(raw)
+            paths = [tmp]
+        mode = radio_restore_mode.value
+        bar_restore.value, bar_restore.visible, txt_restore_status.value = 0, True, "正在恢复..."
+        btn_restore_go.disabled = True; page.update()
+        def on_progress(frac, rows):
+            bar_restore.value, txt_restore_status.value = frac, f"已写入 {rows} 条"
+            page.update()
+        @profiler.timed("restore")
+        def work():
             try:
-                cursor.execute("DELETE FROM workers"); cursor.execute("DELETE FROM owners"); cursor.execute("DELETE FROM logs")
-                if 'workers' in data: cursor.executemany("INSERT INTO workers VALUES (?,?,?)", data['workers'])
-                if 'owners' in data: cursor.executemany("INSERT INTO owners VALUES (?,?)", data['owners'])
-                if 'logs' in data: cursor.executemany("INSERT INTO logs VALUES (?,?,?,?,?,?)", data['logs'])
-                cursor.execute("DELETE FROM sqlite_sequence")
-                db_conn.commit()
-                in_import.value = ""; close_dlg(import_dlg); refresh_ui(); show_toast("恢复成功！")
-            except: db_conn.rollback(); raise
-        except Exception as ex: show_toast(f"恢复失败: {ex}", True)
+                rep = restore.restore(paths, mode, on_progress=on_progress)
+                txt_restore_status.value = f"完成：写入 {rep['rows']} 条，删除 {rep['deleted']} 条" + (f"，跳过 {rep['skipped']} 条坏数据" if rep["skipped"] else "")
+                in_restore_text.value = ""; restore_state["paths"] = []; txt_restore_files.value = "未选择文件"
+                close_dlg(restore_dlg); refresh_ui(); show_toast("恢复成功！" if not rep["skipped"] else f"恢复完成，跳过 {rep['skipped']} 条坏数据")
+            except Exception as ex:
+                txt_restore_status.value = f"恢复失败: {ex}"; show_toast(f"恢复失败: {ex}", True)
+            finally:
+                btn_restore_go.disabled = False; page.update()
+                storage.close()
+                if tmp: os.remove(tmp)
+        page.run_thread(work)
+
+    async def pick_restore_files(e):
+        files = await picker().pick_files(dialog_title="选择备份文件", allow_multiple=True)
+        restore_state["paths"] = [f.path for f in files or [] if f.path]
+        txt_restore_files.value = "\n".join(os.path.basename(p) for p in restore_state["paths"]) or "未选择文件"
+        page.update()
+
+    def build_import():
+        nonlocal import_dlg, in_import
+        in_import = ft.TextField(label="数据区", multiline=True, min_lines=8, max_lines=12, text_size=14)
+        import_dlg = ft.AlertDialog(title=ft.Text("数据"), content=in_import)
+        return import_dlg
 
     def open_text_backup(e):
-        data = {'workers': cursor.execute('SELECT * FROM workers').fetchall(),'owners': cursor.execute('SELECT * FROM owners').fetchall(),'logs': cursor.execute('SELECT * FROM logs').fetchall()}
+        import json
+        need(build_import)
+        data = {'workers': storage.query('SELECT * FROM workers'),'owners': storage.query('SELECT * FROM owners'),'logs': storage.query(storage.over('SELECT * FROM logs'))}
         in_import.value = json.dumps(data, ensure_ascii=False)
         in_import.label = "请长按全选 -> 复制"
         in_import.read_only = False
@@ -206,100 +251,344 @@ def main(page: ft.Page):
         import_dlg.open = True; page.update()
 
     def open_restore_ui(e):
-        in_import.value = ""
-        in_import.label = "请长按 -> 粘贴"
-        in_import.read_only = False
-        import_dlg.title.value = "恢复数据"
-        import_dlg.actions = [ft.TextButton("取消", on_click=lambda _: close_dlg(import_dlg)), ft.FilledButton("确定覆盖", on_click=do_import_data)]
-        import_dlg.open = True; page.update()
+        need(build_restore)
+        bar_restore.visible, txt_restore_status.value = False, ""
+        restore_dlg.open = True; page.update()
+
+    # --- 批量记工：改动先进 pending，预览后一次写入 ---
+    def build_batch():
+        import batch
+        nonlocal batch_dlg, pending, dd_batch_owner, chk_batch_am, chk_batch_pm, chk_batch_all, col_batch_workers
+        nonlocal in_batch_from, in_batch_to, chk_batch_sunday, lv_batch_preview, txt_batch_count, btn_batch_save
+        pending = batch.Batch()
+        dd_batch_owner = ft.Dropdown(label="业主", options=[])
+        chk_batch_am, chk_batch_pm = ft.Checkbox(label="上午", value=True), ft.Checkbox(label="下午", value=True)
+        chk_batch_all = ft.Checkbox(label="全选", value=True, on_change=toggle_batch_all)
+        col_batch_workers = ft.Column(spacing=0, tight=True, scroll=ft.ScrollMode.AUTO, height=150)
+        in_batch_from, in_batch_to = ft.TextField(label="从", width=140, text_size=14), ft.TextField(label="到", width=140, text_size=14)
+        chk_batch_sunday = ft.Checkbox(label="跳过周日", value=False)
+        lv_batch_preview = ft.ListView(spacing=2, height=150)
+        txt_batch_count = ft.Text("", size=14, weight="bold")
+        btn_batch_save = ft.FilledButton("保存", on_click=save_batch)
+        batch_dlg = ft.AlertDialog(title=ft.Text("批量记工"), content=ft.Column([
+            dd_batch_owner, ft.Row([chk_batch_am, chk_batch_pm, chk_batch_all]), col_batch_workers, ft.Divider(),
+            ft.Row([ft.TextButton("标记当天", on_click=batch_do(batch_mark)), ft.TextButton("复制前一天", on_click=batch_do(batch_copy))], alignment="center"),
+            ft.Row([in_batch_from, in_batch_to]), ft.Row([chk_batch_sunday, ft.TextButton("区间填充", on_click=batch_do(batch_fill))]),
+            ft.Divider(), txt_batch_count, lv_batch_preview], tight=True, width=320, scroll=ft.ScrollMode.AUTO),
+            actions=[ft.TextButton("清空", on_click=lambda _: (pending.clear(), render_batch_preview())), ft.TextButton("取消", on_click=lambda _: close_dlg(batch_dlg)), btn_batch_save])
+        return batch_dlg
+
+    def batch_desc(row):
+        if row is None: return "无记录"
+        ao, po, am, pm = row
+        on = batch_names["owners"]
+        return f"上:{on.get(ao, '-')}{'(来)' if am else ''} 下:{on.get(po, '-')}{'(来)' if pm else ''}"
+
+    def render_batch_preview():
+        rows = pending.preview()
+        lv_batch_preview.controls = [ft.Text(f"{d} {batch_names['workers'].get(wid, wid)}  {batch_desc(old)} → {batch_desc(new)}", size=13) for d, wid, old, new in rows]
+        txt_batch_count.value = f"待保存 {len(rows)} 条"
+        btn_batch_save.disabled = not rows
+        page.update()
+
+    def batch_args():
+        wids = [c.data for c in col_batch_workers.controls if c.value]
+        if not wids: raise ValueError("先选工人！")
+        periods = [p for p, c in (("am", chk_batch_am), ("pm", chk_batch_pm)) if c.value]
+        if not periods: raise ValueError("上午、下午至少选一个")
+        return wids, int(dd_batch_owner.value) if dd_batch_owner.value else None, periods
+
+    def batch_do(action):
+        def h(e):
+            try: action()
+            except ValueError as ex: show_toast(str(ex), True)
+            render_batch_preview()  # 出错时改动整体没生效，预览照样刷新，和待保存的内容保持一致
+        return h
+
+    def batch_mark():
+        wids, oid, periods = batch_args()
+        pending.mark(state["view_date"], wids, oid, periods)
+
+    def batch_copy():
+        wids, _, _ = batch_args()
+        pending.copy_day(state["view_date"] - timedelta(days=1), state["view_date"], wids)
+
+    def batch_fill():
+        wids, oid, periods = batch_args()
+        pending.fill_range(date.fromisoformat(in_batch_from.value.strip()), date.fromisoformat(in_batch_to.value.strip()), wids, oid, periods, chk_batch_sunday.value)
+
+    def save_batch(e):
+        try: n = pending.commit()
+        except Exception as ex: show_toast(f"保存失败: {ex}", True); return
+        close_dlg(batch_dlg); refresh_ui(); show_toast(f"已保存 {n} 条")
+
+    def toggle_batch_all(e):
+        for c in col_batch_workers.controls: c.value = chk_batch_all.value
+        page.update()
+
+    def open_batch_ui(e):
+        need(build_batch)
+        pending.clear()
+        batch_names["workers"] = dict(storage.query("SELECT id, name FROM workers ORDER BY id"))
+        batch_names["owners"] = dict(storage.query("SELECT id, name FROM owners ORDER BY id"))
+        dd_batch_owner.options = [ft.dropdown.Option(str(i), n) for i, n in batch_names["owners"].items()]
+        if dd_batch_owner.value and int(dd_batch_owner.value) not in batch_names["owners"]: dd_batch_owner.value = None
+        chk_batch_all.value = True
+        col_batch_workers.controls = [ft.Checkbox(label=n, value=True, data=i) for i, n in batch_names["workers"].items()]
+        in_batch_from.value = (state["view_date"] - timedelta(days=6)).strftime("%Y-%m-%d")
+        in_batch_to.value = state["view_date"].strftime("%Y-%m-%d")
+        batch_dlg.title.value = f"批量记工 {state['view_date'].strftime('%Y-%m-%d')}"
+        batch_dlg.open = True; render_batch_preview()
+
+    # --- 诊断：长按顶部日期栏打开，开关性能记录、查看汇总、导出报告 ---
+    def build_diag():
+        nonlocal diag_dlg, switch_profile, in_diag
+        switch_profile = ft.Switch(label="记录性能数据", value=False, on_change=toggle_profile)
+        in_diag = ft.TextField(multiline=True, min_lines=10, max_lines=16, text_size=12, read_only=True)
+        diag_dlg = ft.AlertDialog(title=ft.Text("诊断"), content=ft.Column([switch_profile, in_diag], tight=True, width=320), actions=[ft.TextButton("清空", on_click=lambda _: (profiler.clear(), show_diag())), ft.TextButton("刷新", on_click=show_diag), ft.TextButton("导出", on_click=export_diag), ft.TextButton("关闭", on_click=lambda _: close_dlg(diag_dlg))])
+        return diag_dlg
+
+    def show_diag(_=None):
+        in_diag.value = profiler.report_text() if profiler.on else profiler.startup_text() + "\n\n未开启。打开上面的开关后操作一会儿再来看。"
+        page.update()
+
+    def toggle_profile(e):
+        storage.set_settings({"profile": "1" if switch_profile.value else "0"})
+        if switch_profile.value: profiler.enable(page)
+        else: profiler.disable()
+        show_diag()
+
+    async def export_diag(e):
+        try:
+            done = await save_as("导出诊断数据", profiler.default_name(), profiler.export)
+            if done: show_toast(f"已导出 {done[0]}")
+        except Exception as ex: show_toast(f"导出失败: {ex}", True)
+
+    def open_diag_ui(e):
+        need(build_diag)
+        switch_profile.value = profiler.on
+        diag_dlg.open = True; show_diag()
 
     # --- 6. 弹窗对象 ---
-    add_dlg = ft.AlertDialog(title=ft.Text("新增资料"), content=ft.Column([in_name, in_rate], tight=True))
-    manage_dlg = ft.AlertDialog(title=ft.Text("管理名单"), content=col_manage, actions=[ft.TextButton("关闭", on_click=lambda _: close_dlg(manage_dlg))])
-    report_dlg = ft.AlertDialog(title=ft.Text("报表"))
-    detail_dlg = ft.AlertDialog(title=ft.Text("明细"), content=col_detail)
-    picker_dlg = ft.AlertDialog(title=ft.Text("选业主"), content=col_owners)
-    import_dlg = ft.AlertDialog(title=ft.Text("数据"), content=in_import)
-    safe_dlg = ft.AlertDialog(title=ft.Text("确认操作"), content=txt_confirm_msg)
-    email_dlg = ft.AlertDialog(title=ft.Text("邮箱配置"), content=ft.Column([ft.Text("需SMTP服务+授权码", size=12, color="grey"), mail_server, mail_user, mail_pass, mail_to, ft.Divider(), switch_auto_backup], tight=True, width=300), actions=[ft.TextButton("取消", on_click=lambda _: close_dlg(email_dlg)), ft.FilledButton("保存", on_click=save_mail_settings)])
+    def build_add():
+        nonlocal add_dlg, in_name, in_rate
+        in_name = ft.TextField(label="名称")
+        in_rate = ft.TextField(label="日薪", keyboard_type="number")
+        add_dlg = ft.AlertDialog(title=ft.Text("新增资料"), content=ft.Column([in_name, in_rate], tight=True), actions=[ft.TextButton("取消", on_click=lambda _: close_dlg(add_dlg)), ft.FilledButton("确定", on_click=on_add_confirm)])
+        return add_dlg
+
+    def build_manage():
+        nonlocal manage_dlg, col_manage
+        col_manage = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=400)
+        manage_dlg = ft.AlertDialog(title=ft.Text("管理名单"), content=col_manage, actions=[ft.TextButton("关闭", on_click=lambda _: close_dlg(manage_dlg))])
+        return manage_dlg
+
+    def build_report():
+        nonlocal report_dlg, col_report
+        col_report = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=400)
+        report_dlg = ft.AlertDialog(title=ft.Text("报表"))
+        return report_dlg
+
+    def build_detail():
+        nonlocal detail_dlg, col_detail, btn_detail_more
+        col_detail = ft.ListView(spacing=10, height=450, width=320, on_scroll=on_detail_scroll)  # 只构建可见的明细行
+        btn_detail_more = ft.TextButton("加载更多", on_click=load_more_detail)
+        detail_dlg = ft.AlertDialog(title=ft.Text("明细"), content=col_detail)
+        return detail_dlg
 
-    page.overlay.extend([add_dlg, manage_dlg, report_dlg, detail_dlg, picker_dlg, import_dlg, safe_dlg, email_dlg])
+    def build_picker():
+        nonlocal picker_dlg, col_owners
+        col_owners = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=400)
+        picker_dlg = ft.AlertDialog(title=ft.Text("选业主"), content=col_owners)
+        return picker_dlg
 
     # --- 7. 业务逻辑 ---
-    def get_logs_data():
+    def report_range():
+        # 当前报表月份的阳历起止日；农历月直接查索引，不再逐行换算
+        import lunar_calendar
         ref = state["report_month"]
-        if state["is_lunar_mode"]:
-            l_ref = ZhDate.from_datetime(datetime(ref.year, ref.month, ref.day))
-            ly, lm = l_ref.lunar_year, l_ref.lunar_month
-            title = f"农历 {ly}年{lm}月账"
-            s, e = ref - timedelta(days=40), ref + timedelta(days=40)
-            cursor.execute('SELECT l.*, w.name, w.daily_rate FROM logs l JOIN workers w ON l.worker_id=w.id WHERE date BETWEEN ? AND ?', (s.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d")))
-            valid = [r for r in cursor.fetchall() if ZhDate.from_datetime(datetime.strptime(r[0], "%Y-%m-%d")).lunar_year == ly and ZhDate.from_datetime(datetime.strptime(r[0], "%Y-%m-%d")).lunar_month == lm]
-            return valid, title
-        else:
-            m_str = ref.strftime("%Y-%m")
-            cursor.execute('SELECT l.*, w.name, w.daily_rate FROM logs l JOIN workers w ON l.worker_id=w.id WHERE date LIKE ?', (f"{m_str}%",))
-            return cursor.fetchall(), f"阳历 {m_str} 账"
+        if state["is_lunar_mode"]: s, e = lunar_calendar.month_range(ref)
+        else: s = ref.replace(day=1); e = (s + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return s.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d")
 
+    @profiler.timed("open_report_ui")
     def open_report_ui(mode="worker"):
+        import lunar_calendar
+        need(build_report)
         col_report.controls.clear()
-        logs, title_text = get_logs_data()
-        report_dlg.title.value = title_text
+        ref = state["report_month"]
+        kind, period = aggregates.period_of(ref, state["is_lunar_mode"])
+        if state["is_lunar_mode"]:
+            ly, lm, _, leap = lunar_calendar.lunar_of(ref)
+            report_dlg.title.value = f"农历 {ly}年{'闰' if leap else ''}{lm}月账"
+        else: report_dlg.title.value = f"阳历 {period} 账"
         if mode == "worker":
-            res = {}
-            for r in logs:
-                wid, name, rate = r[1], r[6], r[7]
-                days = (0.5 if r[4] else 0) + (0.5 if r[5] else 0)
-                if wid not in res: res[wid] = {"n": name, "d": 0, "m": 0}
-                res[wid]["d"] += days; res[wid]["m"] += days * rate
-            for wid, d in res.items():
-                col_report.controls.append(ft.Container(content=ft.Column([ft.Row([ft.Text(d['n'], size=22, weight="bold"), ft.Text("看明细 >")]), ft.Text(f"天数: {d['d']:g} | 工钱: {d['m']:g}元")]), padding=10, bgcolor="grey100", border_radius=8, on_click=lambda _, i=wid, nm=d['n']: open_drill_down(i, nm, "worker")))
+            for wid, name, days, money in report_cache.get(kind, period, mode):
+                col_report.controls.append(ft.Container(content=ft.Column([ft.Row([ft.Text(name, size=22, weight="bold"), ft.Text("看明细 >")]), ft.Text(f"天数: {days:g} | 工钱: {money:g}元")]), padding=10, bgcolor="grey100", border_radius=8, on_click=lambda _, i=wid, nm=name: open_drill_down(i, nm, "worker")))
         else:
-            res = {}
-            cursor.execute("SELECT id, name FROM owners"); o_map = {row[0]: row[1] for row in cursor.fetchall()}
-            for r in logs:
-                rate = r[7]
-                if r[4] and r[2] in o_map: # 上午
-                    if r[2] not in res: res[r[2]] = {"n": o_map[r[2]], "d": 0, "m": 0}
-                    res[r[2]]["d"] += 0.5; res[r[2]]["m"] += 0.5 * rate
-                if r[5] and r[3] in o_map: # 下午
-                    if r[3] not in res: res[r[3]] = {"n": o_map[r[3]], "d": 0, "m": 0}
-                    res[r[3]]["d"] += 0.5; res[r[3]]["m"] += 0.5 * rate
-            for oid, d in res.items():
-                col_report.controls.append(ft.Container(content=ft.Column([ft.Row([ft.Text(d['n'], size=22, weight="bold"), ft.Text("看账单 >")]), ft.Text(f"总额: {d['m']:g} 元 | 总工: {d['d']:g}", weight="bold", color="blue700")]), padding=10, bgcolor="blue50", border_radius=8, on_click=lambda _, i=oid, nm=d['n']: open_drill_down(i, nm, "owner")))
+            for oid, name, days, money in report_cache.get(kind, period, mode):
+                col_report.controls.append(ft.Container(content=ft.Column([ft.Row([ft.Text(name, size=22, weight="bold"), ft.Text("看账单 >")]), ft.Text(f"总额: {money:g} 元 | 总工: {days:g}", weight="bold", color="blue700")]), padding=10, bgcolor="blue50", border_radius=8, on_click=lambda _, i=oid, nm=name: open_drill_down(i, nm, "owner")))
         report_dlg.content = ft.Column([
             ft.Row([ft.Text("阳历"), ft.Switch(value=state["is_lunar_mode"], on_change=lambda e: (state.update(is_lunar_mode=e.control.value), open_report_ui(mode))), ft.Text("农历")], alignment="center"),
             ft.Row([ft.TextButton("工人汇总", on_click=lambda _: open_report_ui("worker")), ft.TextButton("业主汇总", on_click=lambda _: open_report_ui("owner"))], alignment="center"),
             ft.Row([ft.IconButton(ft.Icons.ARROW_LEFT, on_click=lambda _: (state.update(report_month=state["report_month"]-timedelta(days=30)), open_report_ui(mode))), ft.Text("切换月份"), ft.IconButton(ft.Icons.ARROW_RIGHT, on_click=lambda _: (state.update(report_month=state["report_month"]+timedelta(days=30)), open_report_ui(mode)))], alignment="center"),
+            ft.Row([ft.TextButton("区间报表 / 导出 >", on_click=open_range_ui)], alignment="center"),
             ft.Divider(), col_report
         ], tight=True)
         report_dlg.open = True; page.update()
+        report_cache.prefetch(report_cache.neighbours(ref, state["is_lunar_mode"], mode))
+
+    # 区间报表：一段日期按月拆开看合计，可导出 CSV；按阳历还是农历月拆沿用报表上的开关
+    RANGE_SHOW = 300  # 弹窗里最多列这么多行，完整结果导出看
+
+    def build_range():
+        import range_report
+        nonlocal range_dlg, dd_range_preset, in_range_from, in_range_to, radio_range_by, lv_range, txt_range_status, btn_range_export
+        dd_range_preset = ft.Dropdown(label="区间", options=[ft.dropdown.Option(n) for n in range_report.PRESETS], value=range_report.PRESETS[0], on_select=on_range_preset)
+        in_range_from, in_range_to = ft.TextField(label="从", width=140, text_size=14), ft.TextField(label="到", width=140, text_size=14)
+        radio_range_by = ft.RadioGroup(content=ft.Row([ft.Radio(value="worker", label="工人"), ft.Radio(value="owner", label="业主")]), value="worker")
+        lv_range = ft.ListView(spacing=2, height=300)
+        txt_range_status = ft.Text("", size=14)
+        btn_range_export = ft.FilledButton("导出 CSV", on_click=export_range)
+        range_dlg = ft.AlertDialog(title=ft.Text("区间报表"), content=ft.Column([dd_range_preset, ft.Row([in_range_from, in_range_to]), radio_range_by, txt_range_status, lv_range], tight=True, width=320),
+                                   actions=[ft.TextButton("查询", on_click=show_range), ft.TextButton("关闭", on_click=lambda _: (close_dlg(range_dlg), open_report_ui())), btn_range_export])
+        return range_dlg
+
+    def range_args():
+        kind = "lunar" if state["is_lunar_mode"] else "solar"
+        return date.fromisoformat(in_range_from.value.strip()), date.fromisoformat(in_range_to.value.strip()), kind, radio_range_by.value
+
+    def on_range_preset(e=None):
+        import range_report
+        r = range_report.preset(dd_range_preset.value)  # 本季度 / 本年都按今天算，和月报翻到哪个月无关
+        if r: in_range_from.value, in_range_to.value = r[0].strftime("%Y-%m-%d"), r[1].strftime("%Y-%m-%d")
+        page.update()
+
+    @profiler.timed("show_range")
+    def show_range(e=None):
+        import range_report
+        try: s, e_, kind, by = range_args()
+        except ValueError: show_toast("日期格式：2026-01-31", True); return
+        lv_range.controls.clear()
+        try:
+            for n, (_, name, period, days, money) in enumerate(range_report.with_totals(range_report.rows(s, e_, kind, by))):
+                if n == RANGE_SHOW: lv_range.controls.append(ft.Text(f"只显示前 {RANGE_SHOW} 行，完整结果请导出 CSV", color="grey")); break
+                if period in ("小计", ""): lv_range.controls.append(ft.Text(f"{name}{' ' + period if period else ''}：{range_report.num(days)} 工  {range_report.num(money)} 元", weight="bold", color="blue700"))
+                else: lv_range.controls.append(ft.Text(f"{name}  {range_report.label(kind, period)}  {range_report.num(days)} 工  {range_report.num(money)} 元", size=14))
+        except ValueError as ex: show_toast(str(ex), True); return
+        txt_range_status.value = f"{s} 至 {e_}，按{'农历' if kind == 'lunar' else '阳历'}月"
+        page.update()
+
+    async def export_range(e):
+        import range_report
+        try: s, e_, kind, by = range_args()
+        except ValueError: show_toast("日期格式：2026-01-31", True); return
+        btn_range_export.disabled, txt_range_status.value = True, "正在导出..."; page.update()
+        try:
+            done = await save_as("导出区间报表", range_report.default_name(s, e_, kind, by), lambda path: range_report.export_csv(path, s, e_, kind, by))
+            txt_range_status.value = f"已导出 {done[1]} 行：{done[0]}" if done else "已取消导出"
+        except Exception as ex: txt_range_status.value = f"导出失败: {ex}"
+        finally: btn_range_export.disabled = False; page.update()
 
+    def open_range_ui(e):
+        need(build_range)
+        report_dlg.open = False
+        if not in_range_from.value: on_range_preset()
+        range_dlg.open = True; show_range()
+
+    # 明细按页懒加载：每页一条索引查询，滚到底或点“加载更多”再取下一页
+    DETAIL_PAGE = 40
+    detail = {}
+
+    @profiler.timed("load_more_detail")
+    def load_more_detail(_=None):
+        if detail.get("done", True): return
+        detail["done"] = True  # 加载期间挡住重复触发
+        tid, type, s, e, after = detail["tid"], detail["type"], detail["s"], detail["e"], detail["after"]
+        if col_detail.controls and col_detail.controls[-1] is btn_detail_more: col_detail.controls.pop()
+        if type == "worker": rows = storage.drill_worker(tid, s, e, after, DETAIL_PAGE)
+        else: rows = storage.drill_owner(tid, s, e, after, DETAIL_PAGE)
+        for r in rows:
+            solar_d = r[0]
+            display_date = get_lunar_text(date.fromisoformat(solar_d)) if state["is_lunar_mode"] else solar_d
+            if type == "worker":
+                _, am, pm, n1, n2 = r
+                col_detail.controls.append(ft.Container(content=ft.Column([ft.Text(display_date, weight="bold"), ft.Text(f"上:{n1 or '-'} {'(来)' if am else ''} 下:{n2 or '-'} {'(来)' if pm else ''}", size=14)]), padding=10, bgcolor="grey100", border_radius=8, on_click=lambda _, d=solar_d: (state.update(view_date=date.fromisoformat(d)), close_dlg(detail_dlg), close_dlg(report_dlg), refresh_ui())))
+            else:
+                _, _, wname, dv, rate = r
+                col_detail.controls.append(ft.Row([ft.Text(display_date, width=100, weight="bold"), ft.Text(wname, width=80), ft.Text(f"{dv:g}工", width=50), ft.Text(f"{(dv*(rate or 0)):g}元")]))
+        if rows: detail["after"] = r[0] if type == "worker" else (r[0], r[1])
+        if len(rows) == DETAIL_PAGE: detail["done"] = False; col_detail.controls.append(btn_detail_more)
+        if not col_detail.controls: col_detail.controls.append(ft.Text("暂无记录"))
+        page.update()
+
+    def on_detail_scroll(e):
+        if e.max_scroll_extent is not None and e.pixels >= e.max_scroll_extent - 200: load_more_detail()
+
+    @profiler.timed("open_drill_down")
     def open_drill_down(tid, tname, type):
+        need(build_detail)
         col_detail.controls.clear()
-        logs, _ = get_logs_data()
+        s, e = report_range()
+        detail.update(tid=tid, type=type, s=s, e=e, after=None, done=False)
         detail_dlg.title.value = f"【{tname}】农历明细" if state["is_lunar_mode"] else f"【{tname}】阳历明细"
-        for r in logs:
-            solar_d = r[0]
-            if state["is_lunar_mode"]:
-                d_obj = datetime.strptime(solar_d, "%Y-%m-%d").date()
-                display_date = get_lunar_text(d_obj)
-            else: display_date = solar_d
-            if type == "worker" and r[1] == tid:
-                cursor.execute("SELECT name FROM owners WHERE id=?", (r[2],)); n1 = cursor.fetchone()
-                cursor.execute("SELECT name FROM owners WHERE id=?", (r[3],)); n2 = cursor.fetchone()
-                col_detail.controls.append(ft.Container(content=ft.Column([ft.Text(display_date, weight="bold"), ft.Text(f"上:{n1[0] if n1 else '-'} {'(来)' if r[4] else ''} 下:{n2[0] if n2 else '-'} {'(来)' if r[5] else ''}", size=14)]), padding=10, bgcolor="grey100", border_radius=8, on_click=lambda _, d=solar_d: (state.update(view_date=datetime.strptime(d, "%Y-%m-%d").date()), close_dlg(detail_dlg), close_dlg(report_dlg), refresh_ui())))
-            elif type == "owner":
-                dv = (0.5 if r[4] and r[2]==tid else 0) + (0.5 if r[5] and r[3]==tid else 0)
-                if dv > 0: col_detail.controls.append(ft.Row([ft.Text(display_date, width=100, weight="bold"), ft.Text(r[6], width=80), ft.Text(f"{dv:g}工", width=50), ft.Text(f"{(dv*r[7]):g}元")]))
-        if not col_detail.controls: col_detail.controls.append(ft.Text("暂无记录"))
         detail_dlg.actions = [ft.TextButton("返回", on_click=lambda _: (close_dlg(detail_dlg), open_report_ui(type)))]
-        report_dlg.open, detail_dlg.open = False, True; page.update()
+        need(build_report)  # 明细里点日期会顺带关掉报表
+        report_dlg.open, detail_dlg.open = False, True
+        load_more_detail()
+
+    # 当天快照：一条联表查询拿齐所有工人的出勤与业主名，按工人 id 存放
+    day = {"date": None, "rows": {}, "cards": {}}
+
+    def load_day(d_str, wid=None):
+        return {r[0]: r for r in storage.day_view(d_str, wid)}
+
+    def make_toggle(i, k):
+        def h(e):
+            if storage.is_archived(day["date"]): show_toast("这一年已归档，只能查看", True); return
+            _, n, _, ao, po, am, pm, _, _ = day["rows"][i]
+            if (k=='am' and ao is None) or (k=='pm' and po is None): show_toast("先选业主！", True); return
+            def commit():
+                storage.set_attendance(day["date"], i, ao, po, not am if k=='am' else am, not pm if k=='pm' else pm)
+                patch_card(i)
+            ask_confirm(f"修改 {n} 的出勤？", commit)
+        return h
+
+    def build_card(wid):
+        ctl = {
+            "am_owner": ft.TextButton("", on_click=lambda _, i=wid: open_owner_picker_ui(i, "am")),
+            "pm_owner": ft.TextButton("", on_click=lambda _, i=wid: open_owner_picker_ui(i, "pm")),
+            "am_text": ft.Text("", weight="bold"), "pm_text": ft.Text("", weight="bold"),
+            "pay": ft.Text("", size=20, weight="bold", color="blue700"),
+        }
+        ctl["am_box"] = ft.Container(content=ctl["am_text"], alignment=ft.Alignment(0,0), width=145, height=75, border_radius=10, on_click=make_toggle(wid, 'am'))
+        ctl["pm_box"] = ft.Container(content=ctl["pm_text"], alignment=ft.Alignment(0,0), width=145, height=75, border_radius=10, on_click=make_toggle(wid, 'pm'))
+        ctl["name"] = ft.Text("", size=32, weight="bold")
+        ctl["card"] = ft.Container(content=ft.Column([ctl["name"], ft.Row([ft.Column([ctl["am_owner"], ctl["am_box"]], horizontal_alignment="center"), ft.Column([ctl["pm_owner"], ctl["pm_box"]], horizontal_alignment="center")], alignment="center"), ctl["pay"], ft.Divider()]), padding=5)
+        return ctl
+
+    def fill_card(ctl, row):
+        _, name, rate, ao, po, am, pm, n1, n2 = row
+        ctl["name"].value = name
+        ctl["am_owner"].content = n1 if n1 else "选上业主 >"
+        ctl["pm_owner"].content = n2 if n2 else "选下业主 >"
+        ctl["am_text"].value, ctl["am_box"].bgcolor = ("上午来了", "green400") if am else ("上午没来", "grey300")
+        ctl["pm_text"].value, ctl["pm_box"].bgcolor = ("下午来了", "green400") if pm else ("下午没来", "grey300")
+        ctl["pay"].value = f"今日工资：{(((0.5 if am else 0)+(0.5 if pm else 0))*(rate or 0)):g} 元"
 
-    def refresh_ui():
+    def patch_card(wid):
+        # 只重读并改写这一个工人的卡片，其余卡片原样保留
+        row = load_day(day["date"], wid).get(wid)
+        if row is None or wid not in day["cards"]: refresh_ui(); return
+        day["rows"][wid] = row
+        fill_card(day["cards"][wid], row)
+        page.update()
+
+    @profiler.timed("refresh_ui")
+    def refresh_ui(lunar=True):
         today, d_str = date.today(), state["view_date"].strftime("%Y-%m-%d")
         txt_date.value = d_str + (" (今)" if state["view_date"] == today else "")
-        txt_lunar.value = "农历 " + get_lunar_text(state["view_date"])
+        if lunar: txt_lunar.value = "农历 " + get_lunar_text(state["view_date"])  # 首屏先不算农历，画完再补
         btn_back.on_click = lambda _: (state.update(view_date=state["view_date"]-timedelta(days=1)), refresh_ui())
         if state["view_date"] >= today:
             btn_next.disabled, btn_next.icon_color = True, "grey400"
@@ -307,34 +596,26 @@ def main(page: ft.Page):
         else:
             btn_next.disabled, btn_next.icon_color = False, "black"
             btn_next.on_click = lambda _: (state.update(view_date=state["view_date"]+timedelta(days=1)), refresh_ui())
-        col_records.controls.clear()
-        cursor.execute("SELECT id, name, daily_rate FROM workers")
-        for wid, name, rate in cursor.fetchall():
-            cursor.execute('SELECT am_owner_id, pm_owner_id, am, pm FROM logs WHERE date=? AND worker_id=?', (d_str, wid))
-            log = cursor.fetchone(); ao, po, am, pm = log if log else (None, None, 0, 0)
-            cursor.execute("SELECT name FROM owners WHERE id=?", (ao,)); r1 = cursor.fetchone()
-            cursor.execute("SELECT name FROM owners WHERE id=?", (po,)); r2 = cursor.fetchone()
-            
-            def make_toggle(i, n, k, c_log):
-                def h(e):
-                    if (k=='am' and c_log[0] is None) or (k=='pm' and c_log[1] is None): show_toast("先选业主！", True); return
-                    def commit():
-                        cursor.execute("INSERT OR REPLACE INTO logs VALUES (?,?,?,?,?,?)", (d_str, i, c_log[0], c_log[1], not c_log[2] if k=='am' else c_log[2], not c_log[3] if k=='pm' else c_log[3]))
-                        db_conn.commit(); refresh_ui()
-                    ask_confirm(f"修改 {n} 的出勤？", commit)
-                return h
-            col_records.controls.append(ft.Container(content=ft.Column([ft.Text(name, size=32, weight="bold"), ft.Row([ft.Column([ft.TextButton(r1[0] if r1 else "选上业主 >", on_click=lambda _, i=wid: open_owner_picker_ui(i, "am")), ft.Container(content=ft.Text("上午来了" if am else "上午没来", weight="bold"), alignment=ft.Alignment(0,0), width=145, height=75, border_radius=10, bgcolor="green400" if am else "grey300", on_click=make_toggle(wid, name, 'am', (ao, po, am, pm)))], horizontal_alignment="center"), ft.Column([ft.TextButton(r2[0] if r2 else "选下业主 >", on_click=lambda _, i=wid: open_owner_picker_ui(i, "pm")), ft.Container(content=ft.Text("下午来了" if pm else "下午没来", weight="bold"), alignment=ft.Alignment(0,0), width=145, height=75, border_radius=10, bgcolor="green400" if pm else "grey300", on_click=make_toggle(wid, name, 'pm', (ao, po, am, pm)))], horizontal_alignment="center")], alignment="center"), ft.Text(f"今日工资：{(((0.5 if am else 0)+(0.5 if pm else 0))*rate):g} 元", size=20, weight="bold", color="blue700"), ft.Divider()]), padding=5))
+        rows = load_day(d_str)
+        day["date"], day["rows"] = d_str, rows
+        # 工人名单没变就复用已有卡片，只改内容；名单变了才重排
+        if list(rows) != list(day["cards"]):
+            day["cards"] = {wid: day["cards"].get(wid) or build_card(wid) for wid in rows}
+            col_records.controls = [c["card"] for c in day["cards"].values()]
+        for wid, row in rows.items(): fill_card(day["cards"][wid], row)
         page.update()
 
+    @profiler.timed("open_owner_picker_ui")
     def open_owner_picker_ui(wid, period):
+        if storage.is_archived(state["view_date"].strftime("%Y-%m-%d")): show_toast("这一年已归档，只能查看", True); return
+        need(build_picker)
         state["pick_target_wid"], state["pick_target_period"] = wid, period
-        col_owners.controls.clear(); cursor.execute("SELECT id, name FROM owners")
-        for oid, onm in cursor.fetchall():
+        col_owners.controls.clear()
+        for oid, onm in storage.query("SELECT id, name FROM owners"):
             def set_o(e, idx=oid):
                 w, p, ds = state["pick_target_wid"], state["pick_target_period"], state["view_date"].strftime("%Y-%m-%d")
-                cursor.execute("INSERT OR REPLACE INTO logs (date, worker_id, am_owner_id, pm_owner_id, am, pm) SELECT ?,?,?,?,?,? WHERE NOT EXISTS (SELECT 1 FROM logs WHERE date=? AND worker_id=?)", (ds, w, idx if p=='am' else None, idx if p=='pm' else None, 0, 0, ds, w))
-                cursor.execute("UPDATE logs SET am_owner_id=? WHERE date=? AND worker_id=?" if p=='am' else "UPDATE logs SET pm_owner_id=? WHERE date=? AND worker_id=?", (idx, ds, w))
-                db_conn.commit(); close_dlg(picker_dlg); refresh_ui()
+                storage.set_owner(ds, w, p, idx)
+                close_dlg(picker_dlg); patch_card(w)
             col_owners.controls.append(ft.ListTile(title=ft.Text(onm, size=24, weight="bold"), on_click=set_o))
         picker_dlg.open = True; page.update()
 
@@ -342,14 +623,13 @@ def main(page: ft.Page):
     def refresh_manage_list_view(m_type):
         col_manage.controls.clear()
         table = "workers" if m_type == "worker" else "owners"
-        rows = cursor.execute(f"SELECT id, name FROM {table}").fetchall()
+        rows = storage.query(f"SELECT id, name FROM {table}")
         for i, n in rows:
             # 闭包传递 id 和 name
             def create_delete_action(target_id, target_name):
                 def open_safe_dlg(e):
                     def commit_delete():
-                        cursor.execute(f"DELETE FROM {table} WHERE id=?", (target_id,))
-                        db_conn.commit()
+                        storage.delete(table, target_id)
                         show_toast("已删除")
                         # 删除后立即刷新列表，保持管理窗口开启
                         refresh_manage_list_view(m_type)
@@ -364,37 +644,96 @@ def main(page: ft.Page):
 
     def on_add_confirm(e):
         if not in_name.value: return
-        if state["add_mode"]=="worker": cursor.execute("INSERT INTO workers (name, daily_rate) VALUES (?,?)", (in_name.value, float(in_rate.value or 0)))
-        else: cursor.execute("INSERT INTO owners (name) VALUES (?)", (in_name.value,))
-        db_conn.commit(); in_name.value, in_rate.value = "", ""; close_dlg(add_dlg); refresh_ui()
-    add_dlg.actions = [ft.TextButton("取消", on_click=lambda _: close_dlg(add_dlg)), ft.FilledButton("确定", on_click=on_add_confirm)]
+        if state["add_mode"]=="worker": storage.add_worker(in_name.value, float(in_rate.value or 0))
+        else: storage.add_owner(in_name.value)
+        in_name.value, in_rate.value = "", ""; close_dlg(add_dlg); refresh_ui()
+
+    def open_add(mode):
+        need(build_add)
+        in_rate.visible = mode == "worker"
+        state.update(add_mode=mode)
+        add_dlg.open = True; page.update()
 
     def open_manage_list(m):
         # 记录当前在管理谁，然后刷新列表
+        need(build_manage)
         refresh_manage_list_view(m)
         manage_dlg.open = True; page.update()
 
+    # --- 年度归档：结束的年份搬到单独的库文件，查询时自动带上；归档后这一年只能查看 ---
+    def build_archive():
+        nonlocal archive_dlg, col_archive
+        col_archive = ft.Column(spacing=10, tight=True, scroll=ft.ScrollMode.AUTO, height=300)
+        archive_dlg = ft.AlertDialog(title=ft.Text("年度归档"), content=ft.Column([ft.Text("归档后热库变小、备份变快；报表和明细照常能查到，要修改先取消归档", size=12, color="grey"), col_archive], tight=True, width=320),
+                                     actions=[ft.TextButton("关闭", on_click=lambda _: close_dlg(archive_dlg))])
+        return archive_dlg
+
+    def run_archive(action, year):
+        import archive
+        def work():
+            try: msg, err = (f"{year} 年已归档 {archive.archive_year(year)} 条" if action == "archive" else f"{year} 年已搬回 {archive.unarchive(year)} 条"), False
+            except Exception as ex: msg, err = f"操作失败: {ex}", True
+            try: refresh_archive_list(); refresh_ui(); show_toast(msg, err)
+            finally: storage.close()  # 后台线程的连接用完就关
+        ask_confirm(f"{'归档' if action == 'archive' else '取消归档'} {year} 年的记录？", lambda: page.run_thread(work))
+
+    def refresh_archive_list():
+        import archive
+        col_archive.controls.clear()
+        for y, hot, arc, f in archive.status():
+            if f: btn = ft.TextButton("取消归档", on_click=lambda _, y=y: run_archive("unarchive", y))
+            elif archive.closed(y): btn = ft.TextButton("归档", on_click=lambda _, y=y: run_archive("archive", y))
+            else: btn = ft.Text("进行中", color="grey")
+            col_archive.controls.append(ft.Row([ft.Text(f"{y} 年", size=20, weight="bold"), ft.Text(f"已归档 {arc} 条" if f else f"{hot} 条", size=14), btn], alignment="spaceBetween"))
+        page.update()
+
+    def open_archive_ui(e):
+        need(build_archive)
+        refresh_archive_list()
+        archive_dlg.open = True; page.update()
+
     # --- 10. 主入口 ---
     page.appbar = ft.AppBar(title=ft.Text("极简考勤"), bgcolor="blue50", actions=[
         ft.IconButton(ft.Icons.ASSESSMENT, on_click=lambda _: open_report_ui("worker"), icon_color="green", icon_size=35),
         ft.PopupMenuButton(items=[
-            ft.PopupMenuItem(content=ft.Text("新增工人"), on_click=lambda _: (setattr(in_rate, "visible", True), state.update(add_mode="worker"), setattr(add_dlg, "open", True), page.update())),
-            ft.PopupMenuItem(content=ft.Text("新增业主"), on_click=lambda _: (setattr(in_rate, "visible", False), state.update(add_mode="owner"), setattr(add_dlg, "open", True), page.update())),
+            ft.PopupMenuItem(content=ft.Text("新增工人"), on_click=lambda _: open_add("worker")),
+            ft.PopupMenuItem(content=ft.Text("新增业主"), on_click=lambda _: open_add("owner")),
             ft.PopupMenuItem(content=ft.Text("管理工人"), on_click=lambda _: open_manage_list("worker")),
             ft.PopupMenuItem(content=ft.Text("管理业主"), on_click=lambda _: open_manage_list("owner")),
+            ft.PopupMenuItem(content=ft.Text("批量记工"), on_click=open_batch_ui),
             ft.PopupMenuItem(content=ft.Divider()),
             ft.PopupMenuItem(content=ft.Text("手动发送邮件"), on_click=send_backup_email_manual),
             ft.PopupMenuItem(content=ft.Text("设置发件邮箱"), on_click=lambda _: (load_email_settings(), setattr(email_dlg, "open", True), page.update())),
             ft.PopupMenuItem(content=ft.Divider()),
             ft.PopupMenuItem(content=ft.Text("手动复制备份"), on_click=open_text_backup),
             ft.PopupMenuItem(content=ft.Text("恢复数据"), on_click=open_restore_ui),
+            ft.PopupMenuItem(content=ft.Text("年度归档"), on_click=open_archive_ui),
         ])
     ])
 
     page.floating_action_button = ft.FloatingActionButton(bgcolor="blue700", content=ft.Row([ft.Icon(ft.Icons.REPLAY, color="white"), ft.Text("回今天", color="white", weight="bold")], alignment="center", spacing=5), width=120, on_click=lambda _: (state.update(view_date=date.today()), refresh_ui()))
-    check_and_run_auto_backup()
-    refresh_ui()
-    page.add(ft.Container(content=ft.Row([btn_back, ft.Column([txt_date, txt_lunar], horizontal_alignment="center", spacing=-5), btn_next], alignment="spaceBetween"), bgcolor="amber50", height=55, border_radius=10), col_records)
+    phases.mark("controls")
+    refresh_ui(lunar=False)
+    page.add(ft.Container(content=ft.Row([btn_back, ft.Column([txt_date, txt_lunar], horizontal_alignment="center", spacing=-5), btn_next], alignment="spaceBetween"), bgcolor="amber50", height=55, border_radius=10, on_long_press=open_diag_ui), col_records)
+    phases.mark("first_paint")
+
+    # 首屏画出来以后再做：补上农历、导入邮件模块并起后台备份队列（自动备份的检查也在队列线程里做）
+    def after_paint():
+        txt_lunar.value = "农历 " + get_lunar_text(state["view_date"])
+        page.update()
+        n = storage.get_setting("rejected_notice")
+        if n:
+            storage.execute("DELETE FROM settings WHERE key='rejected_notice'")
+            show_toast(f"升级数据库时有 {n} 条记录日期或工人无法识别，已移到 logs_rejected 表里保存", True)
+        import jobs
+        jobs.start(on_backup_status)
+        phases.mark("after_paint"); phases.done()
+    page.run_thread(after_paint)
+    return {"state": state, "restore_state": restore_state, "refresh_ui": refresh_ui, "open_report_ui": open_report_ui,
+            "open_drill_down": open_drill_down, "load_more_detail": load_more_detail, "do_import_data": do_import_data}
+
+def main(page: ft.Page):
+    build_app(page)
 
 if __name__ == "__main__":
     ft.app(main)
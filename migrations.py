@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+# --- 库结构升级：按版本号顺序执行，每步一个保存点，做完在 schema_version 里记一行 ---
+# 版本 0 是 storage.SCHEMA 建出来的老结构（老库都是这个样子）；新增变更只往 MIGRATIONS 末尾追加，已发布的步骤不要再改。
+
+VERSION_SQL = [
+    'CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied TEXT)',
+]
+DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-1][0-9]-[0-3][0-9]"
+
+def _logs_clustered(c):
+    """logs 改成按 (date, worker_id) 聚簇的 WITHOUT ROWID 表：按日期区间读的是连续页，取最早 / 最晚日期直接走主键。
+    日期统一成 YYYY-MM-DD（老版本可能存过不补零的写法，区间比较会错）。认不出的日期、没有工人、补零后和已有记录撞车的行
+    原样挪到 logs_rejected 表里并写明原因，不悄悄丢掉用户数据。"""
+    c.execute(f'''CREATE TABLE logs_new (date TEXT NOT NULL CHECK (date GLOB '{DATE_GLOB}'), worker_id INTEGER NOT NULL,
+                  am_owner_id INTEGER, pm_owner_id INTEGER, am INTEGER NOT NULL DEFAULT 0, pm INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (date, worker_id)) WITHOUT ROWID''')
+    c.execute(f'''INSERT OR REPLACE INTO logs_new SELECT date, worker_id, am_owner_id, pm_owner_id, COALESCE(am, 0), COALESCE(pm, 0)
+                  FROM logs WHERE date GLOB '{DATE_GLOB}' AND worker_id IS NOT NULL ORDER BY rowid''')
+    fixed, rejected = 0, []
+    for row in c.execute(f"SELECT * FROM logs WHERE NOT (date GLOB '{DATE_GLOB}') OR date IS NULL OR worker_id IS NULL").fetchall():
+        fixed += 1
+        d, wid, ao, po, am, pm = row
+        try: d = datetime.strptime(d.strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+        except (AttributeError, ValueError): rejected.append((*row, "日期无法识别")); continue
+        if wid is None: rejected.append((*row, "没有工人")); continue
+        if c.execute("INSERT OR IGNORE INTO logs_new VALUES (?,?,?,?,?,?)", (d, wid, ao, po, am or 0, pm or 0)).rowcount == 0: rejected.append((*row, f"和 {d} 已有的记录重复"))
+    if rejected:
+        c.execute("CREATE TABLE IF NOT EXISTS logs_rejected (date, worker_id, am_owner_id, pm_owner_id, am, pm, reason TEXT)")
+        c.executemany("INSERT INTO logs_rejected VALUES (?,?,?,?,?,?,?)", rejected)
+        c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('rejected_notice', ?)", (str(len(rejected)),))  # 界面启动后提示一次
+    c.execute("DROP TABLE logs")  # 表上的触发器一起删掉，storage.init 随后重建
+    c.execute("ALTER TABLE logs_new RENAME TO logs")
+    if fixed:
+        # 改过的行没进汇总和变更日志：删掉汇总表让 aggregates.init 当新库重算，下次自动备份发全量
+        import backup  # 只在升级时用到，不拖慢平常的启动
+        for t in ("agg_worker", "agg_owner"): c.execute(f"DROP TABLE IF EXISTS {t}")
+        c.execute(backup.RESET_BACKUP_SQL)
+
+def _covering_indexes(c):
+    """明细查询用的覆盖索引：按工人查一段日期、按上午 / 下午业主查一段日期，都不用回表"""
+    for name in ("logs_worker_date", "logs_am_owner_date", "logs_pm_owner_date"): c.execute(f"DROP INDEX IF EXISTS {name}")
+    c.execute("CREATE INDEX logs_worker_cover ON logs (worker_id, date, am, pm, am_owner_id, pm_owner_id)")
+    c.execute("CREATE INDEX logs_am_owner_cover ON logs (am_owner_id, date, worker_id, am)")
+    c.execute("CREATE INDEX logs_pm_owner_cover ON logs (pm_owner_id, date, worker_id, pm)")
+
+def _jobs(c):
+    """后台任务表：同一种任务只能有一条在排队（部分唯一索引），重复提交直接合并"""
+    c.execute('''CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending',
+                 attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL, last_error TEXT, created TEXT)''')
+    c.execute("CREATE UNIQUE INDEX jobs_pending ON jobs (kind) WHERE state = 'pending'")
+
+def _archives(c):
+    """归档登记表：哪些年份的 logs 已搬到单独的年度库文件，及其文件名、行数、版本（归档时的变更序号）"""
+    c.execute('''CREATE TABLE archives (year INTEGER PRIMARY KEY, file TEXT NOT NULL, rows INTEGER NOT NULL,
+                 version INTEGER NOT NULL, archived TEXT)''')
+
+MIGRATIONS = [  # (版本, 说明, 函数)
+    (1, "logs 按日期聚簇、日期格式统一", _logs_clustered),
+    (2, "明细覆盖索引", _covering_indexes),
+    (3, "后台任务队列", _jobs),
+    (4, "年度归档登记", _archives),
+]
+LATEST = MIGRATIONS[-1][0]
+
+def version(c):
+    return c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(c):
+    """在调用方的事务里把库升到最新版本，返回执行了哪些版本"""
+    for sql in VERSION_SQL: c.execute(sql)
+    v = version(c)
+    if v > LATEST: raise RuntimeError(f"数据库版本 {v} 比程序支持的 {LATEST} 新，请先升级程序")
+    done = []
+    for n, _, f in MIGRATIONS:
+        if n <= v: continue
+        c.execute("SAVEPOINT migrate")
+        try:
+            f(c)
+            c.execute("INSERT INTO schema_version (version, applied) VALUES (?,?)", (n, date.today().strftime("%Y-%m-%d")))
+        except: c.execute("ROLLBACK TO migrate"); c.execute("RELEASE migrate"); raise
+        c.execute("RELEASE migrate")
+        done.append(n)
+    return done
@@ -0,0 +1,138 @@
+import functools
+import os
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+import flet as ft
+import storage
+
+# --- 性能记录（默认关闭）：设置表 profile=1 或环境变量 ATTENDANCE_PROFILE=1 时开启 ---
+# SQL：连接类数语句条数（executemany 每行算一条，触发器里的语句不另算）并按语句计时；
+# 界面：timed 装饰的处理函数记耗时、期间的语句数和渲染的控件数。
+# 全部进一个定长的环形缓冲，诊断弹窗里看汇总，也可以导出成 JSON。
+
+ENV = "ATTENDANCE_PROFILE"
+BUFFER = 2000
+on = False
+events = deque(maxlen=BUFFER)  # (时间戳, 类别 sql/ui, 名称, 毫秒, 语句数, 控件数)
+counts = {"statements": 0, "updates": 0}
+startup = {}  # 最近一次启动各阶段的毫秒数，不受开关影响，一直记
+_page = None
+
+class Connection(sqlite3.Connection):
+    """数语句条数；开启记录时再按语句计时（读游标的后续 fetch 不计在内）。
+    不用 sqlite3 的跟踪回调：它对每个触发器子程序都会再报一次父语句，条数会按触发器个数翻倍。"""
+    def execute(self, sql, params=()):
+        counts["statements"] += 1
+        if not on: return super().execute(sql, params)
+        t = time.perf_counter()
+        try: return super().execute(sql, params)
+        finally: events.append((time.time(), "sql", sql, (time.perf_counter() - t) * 1000, 1, 0))
+
+    def executemany(self, sql, rows):
+        def each():
+            for r in rows:
+                counts["statements"] += 1
+                yield r
+        if not on: return super().executemany(sql, each())
+        t, n = time.perf_counter(), counts["statements"]
+        try: return super().executemany(sql, each())
+        finally: events.append((time.time(), "sql", sql, (time.perf_counter() - t) * 1000, counts["statements"] - n, 0))
+
+def wanted(setting=None):
+    return os.environ.get(ENV) == "1" or setting == "1"
+
+def enable(page=None):
+    """开启记录；各线程已打开的连接在下次取用时换成带计时的新连接（storage.renew）"""
+    global on, _page
+    on, _page = True, page
+    storage.factory = Connection
+    storage.renew()
+    if page is not None and not getattr(page, "_profiled", False):
+        update = page.update
+        def counted(*controls):
+            counts["updates"] += 1
+            return update(*controls)
+        page.update, page._profiled = counted, True
+
+def disable():
+    global on
+    on = False
+    storage.factory = sqlite3.Connection
+    storage.renew()
+
+def clear():
+    events.clear(); counts.update(statements=0, updates=0)
+
+def walk(c, out=None):
+    """控件和它下面的所有子控件"""
+    out = [] if out is None else out
+    out.append(c)
+    for a in ("controls", "content", "actions"):
+        v = getattr(c, a, None)
+        for x in (v if isinstance(v, list) else [v]):
+            if isinstance(x, ft.Control): walk(x, out)
+    return out
+
+def count_controls(page):
+    """页面上和打开着的弹窗里的控件数"""
+    if page is None: return 0
+    return sum(len(walk(c)) for c in list(page.controls) + [d for d in page.overlay if getattr(d, "open", True)])
+
+def timed(name):
+    """装饰界面处理函数；未开启时只多一次布尔判断"""
+    def deco(f):
+        @functools.wraps(f)
+        def run(*args, **kwargs):
+            if not on: return f(*args, **kwargs)
+            t, n = time.perf_counter(), counts["statements"]
+            try: return f(*args, **kwargs)
+            finally: events.append((time.time(), "ui", name, (time.perf_counter() - t) * 1000, counts["statements"] - n, count_controls(_page)))
+        return run
+    return deco
+
+class Phases:
+    """启动分段计时：mark(名称) 记下从上一个标记到现在的耗时；t0 是模块导入时刻，给了就先记一段 import"""
+    def __init__(self, t0=None):
+        startup.clear()
+        self.t = self.t0 = time.perf_counter() if t0 is None else t0
+        if t0 is not None: self.mark("import")
+
+    def mark(self, name):
+        now = time.perf_counter()
+        startup[name], self.t = (now - self.t) * 1000, now
+
+    def done(self):
+        startup["total"] = (time.perf_counter() - self.t0) * 1000
+
+def startup_text():
+    return "启动 " + "  ".join(f"{k} {ms:.0f}" for k, ms in startup.items()) + " ms" if startup else ""
+
+def summary(top=15):
+    """按名称汇总缓冲区：次数、总耗时、最长一次；SQL 取总耗时最多的 top 条"""
+    groups = {"ui": {}, "sql": {}}
+    for _, kind, name, ms, n, ctl in list(events):
+        g = groups[kind].setdefault(" ".join(name.split())[:160], {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "statements": 0, "controls": 0})
+        g["count"] += 1; g["total_ms"] += ms; g["max_ms"] = max(g["max_ms"], ms); g["statements"] += n; g["controls"] = ctl
+    order = lambda d: dict(sorted(d.items(), key=lambda kv: -kv[1]["total_ms"]))
+    return {"events": len(events), **counts, "ui": order(groups["ui"]), "sql": dict(list(order(groups["sql"]).items())[:top])}
+
+def report_text():
+    s = summary()
+    lines = [startup_text(), f"缓冲 {s['events']} 条  SQL 语句 {s['statements']} 条  页面刷新 {s['updates']} 次", "", "【界面】次数 / 平均 / 最长 ms / 语句 / 控件"]
+    for k, g in s["ui"].items(): lines.append(f"{k}: {g['count']} / {g['total_ms'] / g['count']:.1f} / {g['max_ms']:.1f} / {g['statements']} / {g['controls']}")
+    lines += ["", "【SQL】次数 / 总计 / 最长 ms"]
+    for k, g in s["sql"].items(): lines.append(f"{g['count']} / {g['total_ms']:.1f} / {g['max_ms']:.1f}  {k}")
+    return "\n".join(lines)
+
+def default_name():
+    return f"profile_{datetime.now():%Y%m%d_%H%M%S}.json"
+
+def export(path=None):
+    """汇总加原始事件写成 JSON，返回文件路径；不给路径就写到当前目录"""
+    path = path or default_name()
+    import json
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"time": datetime.now().isoformat(timespec="seconds"), "summary": summary(), "startup": startup, "events": list(events)}, f, ensure_ascii=False, indent=1)
+    return path
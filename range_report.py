@@ -0,0 +1,115 @@
+import argparse
+import csv
+from datetime import date, timedelta
+import aggregates
+import storage
+
+# --- 区间报表：任意一段日期（一季度、一个农历年、自定义）按月拆开，天数和工钱在 SQLite 里 GROUP BY 算好 ---
+# 阳历月直接取日期前 7 位；农历月连 cal_days 取月份键（闰月带 R），不在 Python 里逐行换算。
+# 有记录没出工（0 天）的工人也列出来，和月报一致。rows() 从游标逐行产出，导出 CSV 时边读边写，多年的数据也不会整体进内存。工钱和月报一样按当前日薪算。
+
+BY = ("worker", "owner")
+PRESETS = ("本季度", "本年", "农历本年", "去年", "农历去年", "自定义")
+
+_PERIOD = {"solar": ("substr(l.date, 1, 7)", ""), "lunar": ("c.lunar", "JOIN cal_days c ON c.date = l.date")}
+
+WORKER_SQL = '''
+    SELECT l.worker_id, w.name, {period} AS period, SUM((l.am <> 0) + (l.pm <> 0)) AS half,
+           SUM((l.am <> 0) + (l.pm <> 0)) * 0.5 * COALESCE(w.daily_rate, 0)
+    FROM logs l {join} JOIN workers w ON w.id = l.worker_id
+    WHERE l.date BETWEEN ?1 AND ?2
+    GROUP BY l.worker_id, period ORDER BY l.worker_id, period'''
+
+OWNER_SQL = '''
+    SELECT x.owner_id, o.name, x.period, COUNT(*), SUM(COALESCE(w.daily_rate, 0)) * 0.5
+    FROM (SELECT l.am_owner_id AS owner_id, l.worker_id, {period} AS period FROM logs l {join}
+          WHERE l.date BETWEEN ?1 AND ?2 AND l.am <> 0 AND l.am_owner_id IS NOT NULL
+          UNION ALL
+          SELECT l.pm_owner_id, l.worker_id, {period} FROM logs l {join}
+          WHERE l.date BETWEEN ?1 AND ?2 AND l.pm <> 0 AND l.pm_owner_id IS NOT NULL) x
+    JOIN owners o ON o.id = x.owner_id JOIN workers w ON w.id = x.worker_id
+    GROUP BY x.owner_id, x.period ORDER BY x.owner_id, x.period'''
+
+def sql(kind, by):
+    period, join = _PERIOD[kind]
+    return (WORKER_SQL if by == "worker" else OWNER_SQL).format(period=period, join=join)
+
+def lunar_year(c, ly):
+    """农历 ly 年（正月初一到除夕）的阳历起止日，边界取自 cal_days"""
+    aggregates.cover_years(c, ly, ly + 1)
+    s, e = c.execute("SELECT MIN(date), MAX(date) FROM cal_days WHERE lunar >= ? AND lunar < ?", (f"{ly:04d}-01", f"{ly + 1:04d}-01")).fetchone()
+    return date.fromisoformat(s), date.fromisoformat(e)
+
+def preset(name, today=None, c=None):
+    """常用区间的 (起, 止)；“自定义”返回 None"""
+    today, c = today or date.today(), c or storage.conn()
+    if name == "本季度":
+        s = date(today.year, (today.month - 1) // 3 * 3 + 1, 1)
+        return s, (s + timedelta(days=93)).replace(day=1) - timedelta(days=1)
+    if name in ("本年", "去年"):
+        y = today.year - (name == "去年")
+        return date(y, 1, 1), date(y, 12, 31)
+    if name in ("农历本年", "农历去年"):
+        ly = aggregates.lunar_period(today)[:4]
+        return lunar_year(c, int(ly) - (name == "农历去年"))
+    return None
+
+def label(kind, period):
+    """月份键的显示文字：2026-03 -> 2026年3月，农历 2026-06R -> 农历2026年闰6月"""
+    if period is None: return ""
+    y, m = period[:4], int(period[5:7])
+    return f"农历{y}年{'闰' if period.endswith('R') else ''}{m}月" if kind == "lunar" else f"{y}年{m}月"
+
+def rows(s, e, kind="solar", by="worker", c=None):
+    """逐行产出 (id, 名称, 月份键, 天数, 工钱)，按 id、月份排好"""
+    if s > e: raise ValueError("开始日期不能晚于结束日期")
+    c = c or storage.conn()
+    if kind == "lunar": aggregates.cover_years(c, *range(s.year, e.year + 1))
+    s_str, e_str = s.strftime("%Y-%m-%d"), e.strftime("%Y-%m-%d")
+    for oid, name, period, half, money in c.execute(storage.over(sql(kind, by), s_str, e_str, c), (s_str, e_str)):  # 碰到已归档年份时附加归档库
+        yield oid, name, period, half * 0.5, money
+
+def with_totals(it):
+    """在每个工人 / 业主的月份行后面插一行小计（月份为 "小计"），最后一行合计；只记着当前这一个人的累计"""
+    last, sub, total = None, [0, 0], [0, 0]
+    for r in it:
+        if last is not None and r[0] != last[0]: yield (last[0], last[1], "小计", *sub); sub = [0, 0]
+        last = r
+        sub[0] += r[3]; sub[1] += r[4]; total[0] += r[3]; total[1] += r[4]
+        yield r
+    if last is not None: yield (last[0], last[1], "小计", *sub)
+    yield (None, "合计", "", *total)
+
+def num(x):
+    """CSV 和界面里的数字：最多两位小数，去掉多余的 0，不用科学计数法"""
+    return f"{x:.2f}".rstrip("0").rstrip(".")
+
+def export_csv(path, s, e, kind="solar", by="worker"):
+    """边查边写 CSV（带 BOM，Excel 直接打开不乱码），返回写入的行数（含小计、合计）"""
+    n = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["编号", "工人" if by == "worker" else "业主", "月份", "天数", "工钱"])
+        for oid, name, period, days, money in with_totals(rows(s, e, kind, by)):
+            w.writerow(["" if oid is None else oid, name, period if period in ("小计", "") else label(kind, period), num(days), num(money)])
+            n += 1
+    return n
+
+def default_name(s, e, kind, by):
+    return f"区间{'工人' if by == 'worker' else '业主'}_{'农历' if kind == 'lunar' else '阳历'}_{s:%Y%m%d}-{e:%Y%m%d}.csv"
+
+if __name__ == "__main__":
+    # 年底对账：python range_report.py 2026-01-01 2026-12-31 --by owner --lunar --out 2026业主.csv
+    ap = argparse.ArgumentParser(description="区间报表导出 CSV")
+    ap.add_argument("start", type=date.fromisoformat)
+    ap.add_argument("end", type=date.fromisoformat)
+    ap.add_argument("--by", choices=BY, default="worker")
+    ap.add_argument("--lunar", action="store_true", help="按农历月拆分")
+    ap.add_argument("--out")
+    ap.add_argument("--db")
+    a = ap.parse_args()
+    storage.init(a.db)
+    kind = "lunar" if a.lunar else "solar"
+    out = a.out or default_name(a.start, a.end, kind, a.by)
+    print("已写入", export_csv(out, a.start, a.end, kind, a.by), "行 ->", out)
+    storage.close()
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+import aggregates
+import storage
+
+# --- 报表结果缓存：(solar/lunar, 月份, worker/owner) -> 报表行，LRU 淘汰 ---
+# storage 每次写入后通知受影响的日期 / 工人 / 业主，这里只丢掉对应月份的缓存；
+# 打开某个月的报表后，后台线程顺手算好前后两个月和另一种汇总，翻月份时直接命中。
+
+MAX = 24
+_cache = OrderedDict()
+_lock = threading.Lock()
+_gen = 0  # 每次失效加一，后台算到一半遇到失效就不写回旧结果
+_pending = set()
+
+def _compute(c, kind, period, mode):
+    return (aggregates.worker_report if mode == "worker" else aggregates.owner_report)(c, kind, period)
+
+def _put(key, rows, gen):
+    with _lock:
+        if gen != _gen: return
+        _cache[key] = rows; _cache.move_to_end(key)
+        while len(_cache) > MAX: _cache.popitem(last=False)
+
+def get(kind, period, mode):
+    key = (kind, period, mode)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key); return _cache[key]
+        gen = _gen
+    rows = _compute(storage.conn(), kind, period, mode)
+    _put(key, rows, gen)
+    return rows
+
+def clear():
+    global _gen
+    with _lock: _gen += 1; _cache.clear()
+
+def _drop(periods):
+    global _gen
+    with _lock:
+        _gen += 1
+        for key in [k for k in _cache if k[:2] in periods]: del _cache[key]
+
+def on_write(table, keys=None):
+    """storage 写入后的回调：logs 传日期，workers / owners 传 id；keys 为 None 表示整表都可能变了"""
+    if table is None or keys is None: clear(); return
+    if table == "logs":
+        periods = {p for d in keys for p in (aggregates.period_of(date.fromisoformat(d), False), aggregates.period_of(date.fromisoformat(d), True))}
+    else:
+        # 改了工人 / 业主：只有他出现过的月份要重算
+        col, agg = ("worker_id", "agg_worker") if table == "workers" else ("owner_id", "agg_owner")
+        periods = set()
+        for i in keys: periods.update(storage.query(f"SELECT DISTINCT kind, period FROM {agg} WHERE {col}=?", (i,)))
+    _drop(periods)
+
+storage.listeners.append(on_write)
+
+def neighbours(ref, is_lunar, mode):
+    """翻月份按钮前后各 30 天所在的月，以及同一个月的另一种汇总"""
+    other = "owner" if mode == "worker" else "worker"
+    return [(*aggregates.period_of(ref + timedelta(days=dd), is_lunar), m) for dd, m in ((-30, mode), (30, mode), (0, other))]
+
+def prefetch(keys):
+    """后台线程用自己的连接把还没缓存的键算好"""
+    with _lock:
+        todo = [k for k in keys if k not in _cache and k not in _pending]
+        _pending.update(todo); gen = _gen
+    if not todo: return
+    def work():
+        try:
+            c = storage.conn()
+            for key in todo: _put(key, _compute(c, *key), gen)
+        finally:
+            with _lock: _pending.difference_update(todo)
+            storage.close()
+    threading.Thread(target=work, daemon=True).start()
@@ -0,0 +1,243 @@
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import date
+import aggregates
+import archive
+import backup
+import storage
+
+# --- 恢复引擎：分块读文件、逐行校验、按批写入 ---
+# 支持两种文件：backup 模块发出的 gzip JSON 行格式（全量 + 增量），以及旧版“手动复制备份”的整段 JSON
+# （{"workers": [...], "owners": [...], "logs": [...]}，可以是纯文本也可以 gzip 过）。
+# 两种模式：replace 先清空三张表再写入；merge 按 id / (date, worker_id) 覆盖同键行，备份里没有的数据原样保留。
+# 归档附件（kind: archive）整年替换对应的归档库，可以单独选也可以和全量 / 增量一起选；没选到的归档库两种模式都不动。
+
+CHUNK = 64 * 1024
+BATCH = 500
+MAX_ERRORS = 20  # 报告里最多带多少条出错行的说明
+_dec = json.JSONDecoder()
+
+class _Reader:
+    """按块读取文本流，一次解出一个 JSON 值，不把整个文件读进内存"""
+    def __init__(self, f):
+        self.f, self.buf, self.i, self.eof = f, "", 0, False
+
+    def _more(self):
+        chunk = self.f.read(CHUNK)
+        if not chunk: self.eof = True; return False
+        self.buf, self.i = self.buf[self.i:] + chunk, 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.i < len(self.buf) and self.buf[self.i] in " \t\r\n": self.i += 1
+            if self.i < len(self.buf): return self.buf[self.i]
+            if not self._more(): return ""
+
+    def startswith(self, s):
+        self.peek()
+        while len(self.buf) - self.i < len(s) and self._more(): pass
+        return self.buf.startswith(s, self.i)
+
+    def take(self, ch):
+        if self.peek() != ch: raise ValueError(f"格式错误：应为 '{ch}'")
+        self.i += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                v, end = _dec.raw_decode(self.buf, self.i)
+                if end == len(self.buf) and not self.eof and self._more(): continue  # 数字可能被块边界截断
+                self.i = end
+                return v
+            except json.JSONDecodeError:
+                if not self._more(): raise ValueError("格式错误：文件不完整")
+
+def _legacy_items(r):
+    """旧版整段 JSON：逐个解出数组元素"""
+    r.take("{")
+    while r.peek() != "}":
+        key = r.value(); r.take(":")
+        if key not in storage.TABLES: r.value()  # 不认识的键整体跳过
+        else:
+            r.take("[")
+            while r.peek() != "]":
+                yield {"t": key, "r": r.value()}
+                if r.peek() == ",": r.take(",")
+            r.take("]")
+        if r.peek() == ",": r.take(",")
+
+def _jsonl_items(r):
+    while r.peek():
+        yield r.value()
+
+class _Source:
+    def __init__(self, path):
+        self.path, self.raw = path, open(path, "rb")
+        try: self._open()
+        except: self.raw.close(); raise
+
+    def _open(self):
+        path = self.path
+        gz = self.raw.read(2) == b"\x1f\x8b"; self.raw.seek(0)
+        self.reader = _Reader(gzip.open(self.raw, "rt", encoding="utf-8") if gz else io.TextIOWrapper(self.raw, encoding="utf-8-sig"))
+        if self.reader.startswith('{"format"'):
+            self.head = self.reader.value()
+            if self.head.get("format") != "attendance-backup": raise ValueError(f"{os.path.basename(path)} 不是考勤备份文件")
+            self.items = _jsonl_items(self.reader)
+        elif self.reader.peek() == "{":
+            self.head = {"kind": "full", "seq": None, "since": 0}  # 旧版整段 JSON 当作全量
+            self.items = _legacy_items(self.reader)
+        else: raise ValueError(f"{os.path.basename(path)} 不是考勤备份文件")
+
+    def close(self): self.raw.close()
+
+def _int(v, nullable=False):
+    if v is None and nullable: return None
+    if isinstance(v, bool) or not isinstance(v, int): raise ValueError(f"应为整数: {v!r}")
+    return v
+
+def _check(item):
+    """校验并规整一行，返回 (表名, 是否删除, 值元组)"""
+    t = item.get("t") if isinstance(item, dict) else None
+    if t not in storage.TABLES: raise ValueError(f"未知表: {t!r}")
+    cols, pk = storage.TABLES[t]
+    if "del" in item:
+        k = item["del"]
+        if not isinstance(k, list) or len(k) != len(pk): raise ValueError(f"{t} 删除键不对: {k!r}")
+        return t, True, tuple(k)
+    r = item.get("r")
+    if not isinstance(r, list) or len(r) != len(cols): raise ValueError(f"{t} 列数不对: {r!r}")
+    if t == "logs":
+        d, wid, ao, po, am, pm = r
+        if not isinstance(d, str): raise ValueError(f"日期不对: {d!r}")
+        d = date.fromisoformat(d).strftime("%Y-%m-%d")
+        return t, False, (d, _int(wid), _int(ao, True), _int(po, True), 1 if am else 0, 1 if pm else 0)
+    if r[1] is not None and not isinstance(r[1], str): raise ValueError(f"名称不对: {r[1]!r}")
+    if t == "workers":
+        if r[2] is not None and (isinstance(r[2], bool) or not isinstance(r[2], (int, float))): raise ValueError(f"日薪不对: {r[2]!r}")
+        return t, False, (_int(r[0]), r[1], r[2])
+    return t, False, (_int(r[0]), r[1])
+
+def _stage(c, s, report):
+    """把一个归档附件写进新的归档库文件（先不登记），返回 (年份, 版本, 文件名, 库名)"""
+    year = _int(s.head.get("year"))
+    version, name = archive.new_file(c, year)
+    sch = archive.create(c, year, version, name)
+    try:
+        n, lo, hi = 0, f"{year:04d}-01-01", f"{year:04d}-12-31"
+        with storage.transaction():
+            rows = []
+            for item in s.items:
+                try:
+                    t, is_del, vals = _check(item)
+                    if t != "logs" or is_del or not lo <= vals[0] <= hi: raise ValueError(f"不是 {year} 年的记录: {item!r}"[:120])
+                except (ValueError, TypeError) as ex:
+                    report["skipped"] += 1
+                    if len(report["errors"]) < MAX_ERRORS: report["errors"].append(f"{os.path.basename(s.path)}: {ex}")
+                    continue
+                rows.append(vals)
+                if len(rows) >= BATCH: c.executemany(f"INSERT INTO {sch}.logs VALUES (?,?,?,?,?,?)", rows); n += len(rows); rows = []
+            c.executemany(f"INSERT INTO {sch}.logs VALUES (?,?,?,?,?,?)", rows); n += len(rows)
+            got = c.execute(f"SELECT COUNT(*) FROM {sch}.logs").fetchone()[0]
+            if got != n: raise RuntimeError(f"{year} 年归档写入 {got} 行，应为 {n} 行")
+        report["rows"] += n
+        return year, version, name, sch
+    except:
+        archive.discard(c, sch, name); raise
+
+def _order(sources):
+    """全量在前、增量按序号排好并检查首尾相接"""
+    fulls = [s for s in sources if s.head["kind"] == "full"]
+    deltas = sorted((s for s in sources if s.head["kind"] == "delta"), key=lambda s: s.head["seq"])
+    if len(fulls) > 1: raise ValueError("只能有一个全量备份")
+    seq = fulls[0].head["seq"] if fulls else None
+    for s in deltas:
+        if seq is not None and s.head["since"] > seq: raise ValueError(f"增量备份不连续：缺少序号 {seq} 之后的变更")
+        seq = s.head["seq"]
+    return fulls + deltas
+
+def restore(paths, mode="replace", batch_size=BATCH, on_progress=None):
+    """从备份文件恢复。mode: replace / merge；on_progress(已读比例, 已写行数) 每批回调一次。
+    热库的写入在一个事务里，任何读写错误都会整体回滚；归档附件先写进新文件，和热库在同一个事务里登记，
+    失败时新文件删掉、原来的归档不变。单行校验失败只跳过该行并记入报告。"""
+    if mode not in ("replace", "merge"): raise ValueError(f"未知模式: {mode}")
+    opened, staged = [], []
+    try:
+        for p in paths: opened.append(_Source(p))
+        if not opened: raise ValueError("没有选择备份文件")
+        arcs = [s for s in opened if s.head["kind"] == "archive"]
+        sources = _order([s for s in opened if s.head["kind"] != "archive"])
+        if mode == "replace" and sources and sources[0].head["kind"] != "full": raise ValueError("覆盖恢复需要全量备份，增量请用合并模式")
+        if len({s.head.get("year") for s in arcs}) < len(arcs): raise ValueError("同一年的归档只能选一个")
+        total = sum(os.path.getsize(s.path) for s in opened) or 1
+        done_bytes, report = 0, {"rows": 0, "deleted": 0, "skipped": 0, "errors": []}
+        c = storage.conn()
+        for s in arcs:
+            staged.append(_stage(c, s, report))
+            done_bytes += os.path.getsize(s.path)
+            if on_progress: on_progress(min(1.0, done_bytes / total), report["rows"])
+        old = {y: f for y, f, _ in storage.archives(c)}
+        # 事务里不能 ATTACH：重算汇总要读的归档库（原有的 + 新写的）先附加好
+        storage.attach(c, [(y, f, v) for y, f, v in storage.archives(c) if y not in {st[0] for st in staged}] + [(y, name, v) for y, v, name, _ in staged])
+        upsert, delete = {}, {}
+        for t, (cols, pk) in storage.TABLES.items():
+            sets = ", ".join(f"{c}=excluded.{c}" for c in cols if c not in pk)
+            upsert[t] = f"INSERT INTO {t} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) ON CONFLICT ({', '.join(pk)}) DO UPDATE SET {sets}"
+            delete[t] = f"DELETE FROM {t} WHERE " + " AND ".join(f"{k}=?" for k in pk)
+        with storage.transaction() as c, storage.triggers_paused(c):
+            if mode == "replace" and sources:  # 只选了归档附件时热库不动
+                for t in storage.TABLES: c.execute(f"DELETE FROM {t}")
+            for s in sources:
+                pending = {}
+                def flush():
+                    for (t, is_del), rows in pending.items():
+                        c.executemany(delete[t] if is_del else upsert[t], rows)
+                        report["deleted" if is_del else "rows"] += len(rows)
+                    pending.clear()
+                    if on_progress: on_progress(min(1.0, (done_bytes + s.raw.tell()) / total), report["rows"])
+                n = 0
+                for item in s.items:
+                    try: t, is_del, vals = _check(item)
+                    except (ValueError, TypeError) as ex:
+                        report["skipped"] += 1
+                        if len(report["errors"]) < MAX_ERRORS: report["errors"].append(f"{os.path.basename(s.path)}: {ex}")
+                        continue
+                    pending.setdefault((t, is_del), []).append(vals); n += 1
+                    if n % batch_size == 0: flush()
+                flush()  # 每个文件写完再读下一个，保证增量按顺序生效
+                done_bytes += os.path.getsize(s.path)
+            if mode == "replace" and sources: c.execute("DELETE FROM sqlite_sequence")
+            for y, v, name, _ in staged:
+                n = c.execute(f"SELECT COUNT(*) FROM {storage.archive_schema(y, v)}.logs").fetchone()[0]
+                c.execute("INSERT INTO archives (year, file, rows, version, archived) VALUES (?,?,?,?,?) ON CONFLICT (year) DO UPDATE SET file=excluded.file, rows=excluded.rows, version=excluded.version, archived=excluded.archived",
+                          (y, name, n, v, date.today().strftime("%Y-%m-%d")))
+            for (y,) in c.execute("SELECT year FROM archives").fetchall():
+                if c.execute("SELECT 1 FROM main.logs WHERE date BETWEEN ? AND ? LIMIT 1", (f"{y:04d}-01-01", f"{y:04d}-12-31")).fetchone():
+                    raise ValueError(f"备份里有 {y} 年的记录，但这一年已经归档；先取消归档再恢复")
+            # 触发器暂停期间的变更没进日志，下次自动备份重新发全量
+            c.execute("DELETE FROM changes")
+            c.execute(backup.RESET_BACKUP_SQL)
+            aggregates.rebuild(c)
+        for y, _, name, _ in staged:  # 登记已提交，被替换的旧归档文件可以删了
+            if old.get(y) and old[y] != name: os.remove(os.path.join(storage.db_dir(), old[y]))
+        staged = []
+        storage.forget_archives()
+        storage.notify()
+        if on_progress: on_progress(1.0, report["rows"])
+        return report
+    finally:
+        for y, _, name, sch in staged: archive.discard(storage.conn(), sch, name)
+        storage.forget_archives()
+        for s in opened: s.close()
+
+if __name__ == "__main__":
+    # 命令行恢复：python restore.py [--merge] 全量.jsonl.gz [增量1.jsonl.gz ...] [归档.jsonl.gz ...]
+    args = sys.argv[1:]
+    mode = "merge" if "--merge" in args else "replace"
+    storage.init()
+    print(restore([a for a in args if a != "--merge"], mode, on_progress=lambda p, n: print(f"\r{p:.0%} {n} 条", end="")))
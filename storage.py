@@ -0,0 +1,277 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+import aggregates
+import migrations
+
+# --- 数据访问层：每个线程一条连接，WAL 模式下界面写入和后台备份互不阻塞 ---
+DB_FILE = "attendance_pro_v230_named.db"
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",   # WAL 下 NORMAL 已能保证不坏库，只是断电可能丢最后一笔
+    "PRAGMA cache_size = -8000",     # 约 8MB 页缓存
+    "PRAGMA mmap_size = 67108864",   # 64MB 内存映射读
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",    # 另一线程正在写时最多等 5 秒，不直接报 database is locked
+    "PRAGMA recursive_triggers = ON",  # INSERT OR REPLACE 覆盖旧记录时也要扣减汇总
+]
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS workers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, daily_rate REAL)',
+    'CREATE TABLE IF NOT EXISTS owners (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT)',
+    '''CREATE TABLE IF NOT EXISTS logs
+       (date TEXT, worker_id INTEGER, am_owner_id INTEGER, pm_owner_id INTEGER,
+        am INTEGER, pm INTEGER, PRIMARY KEY (date, worker_id))''',
+    'CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS trigger_pause (x)',  # 有行时所有维护触发器跳过，只在批量事务内部临时写入
+]  # 之后的结构变更（logs 聚簇、索引）见 migrations
+PAUSE_WHEN = "WHEN NOT EXISTS (SELECT 1 FROM trigger_pause)"
+
+# --- 变更日志：每个被改过的主键记一行及当时的序号，增量备份据此只导出变过的行（含删除） ---
+TABLES = {  # 表名: (列, 主键列)
+    "workers": (("id", "name", "daily_rate"), ("id",)),
+    "owners": (("id", "name"), ("id",)),
+    "logs": (("date", "worker_id", "am_owner_id", "pm_owner_id", "am", "pm"), ("date", "worker_id")),
+}
+JOURNAL = [
+    'CREATE TABLE IF NOT EXISTS changes (tbl TEXT, k1, k2, seq INTEGER, PRIMARY KEY (tbl, k1, k2)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS changes_seq ON changes (seq)',
+    'CREATE TABLE IF NOT EXISTS change_seq (n INTEGER)',  # 单行计数器，清理 changes 后序号也不会回退
+    'INSERT INTO change_seq SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_seq)',
+]
+
+def _journal_triggers():
+    out = {}
+    for t, (_, pk) in TABLES.items():
+        for ev, rows in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+            body = "UPDATE change_seq SET n = n + 1;"
+            for R in rows:
+                k2 = f"{R}.{pk[1]}" if len(pk) > 1 else "0"
+                body += f" INSERT INTO changes (tbl, k1, k2, seq) VALUES ('{t}', {R}.{pk[0]}, {k2}, (SELECT n FROM change_seq)) ON CONFLICT (tbl, k1, k2) DO UPDATE SET seq = excluded.seq;"
+            out[f"journal_{t}_{ev.lower()}"] = (f"AFTER {ev} ON {t}", body)
+    return out
+
+# 已归档年份在热库里只读：再写进来就和归档库重复了，要改先取消归档
+GUARD_TRIGGERS = {
+    "archive_guard": ("BEFORE INSERT ON logs", "SELECT RAISE(ABORT, '该年份已归档，先取消归档再修改') WHERE EXISTS (SELECT 1 FROM archives WHERE year = CAST(substr(NEW.date, 1, 4) AS INTEGER));"),
+}
+
+# --- 热点语句：固定文本，命中 sqlite3 连接自带的预编译语句缓存 ---
+DAY_SQL = '''SELECT w.id, w.name, w.daily_rate, l.am_owner_id, l.pm_owner_id, COALESCE(l.am, 0), COALESCE(l.pm, 0), o1.name, o2.name
+             FROM workers w LEFT JOIN logs l ON l.worker_id=w.id AND l.date=?
+             LEFT JOIN owners o1 ON o1.id=l.am_owner_id LEFT JOIN owners o2 ON o2.id=l.pm_owner_id'''
+DAY_ALL_SQL = DAY_SQL + " ORDER BY w.id"
+DAY_ONE_SQL = DAY_SQL + " WHERE w.id=?"
+TOGGLE_SQL = '''INSERT INTO logs (date, worker_id, am_owner_id, pm_owner_id, am, pm) VALUES (?,?,?,?,?,?)
+                ON CONFLICT (date, worker_id) DO UPDATE SET am=excluded.am, pm=excluded.pm'''
+BATCH_SQL = '''INSERT INTO logs (date, worker_id, am_owner_id, pm_owner_id, am, pm) VALUES (?,?,?,?,?,?)
+               ON CONFLICT (date, worker_id) DO UPDATE SET am_owner_id=excluded.am_owner_id, pm_owner_id=excluded.pm_owner_id, am=excluded.am, pm=excluded.pm'''
+OWNER_SQL = {
+    "am": '''INSERT INTO logs (date, worker_id, am_owner_id, pm_owner_id, am, pm) VALUES (?,?,?,NULL,0,0)
+             ON CONFLICT (date, worker_id) DO UPDATE SET am_owner_id=excluded.am_owner_id''',
+    "pm": '''INSERT INTO logs (date, worker_id, am_owner_id, pm_owner_id, am, pm) VALUES (?,?,NULL,?,0,0)
+             ON CONFLICT (date, worker_id) DO UPDATE SET pm_owner_id=excluded.pm_owner_id''',
+}
+# 明细分页：按 (日期[, 工人]) 键集翻页，业主名在 SQL 里联表取；业主明细拆成上午 / 下午两段，各走一个覆盖索引
+DRILL_WORKER_SQL = '''SELECT l.date, l.am, l.pm, o1.name, o2.name FROM logs l
+                      LEFT JOIN owners o1 ON o1.id=l.am_owner_id LEFT JOIN owners o2 ON o2.id=l.pm_owner_id
+                      WHERE l.worker_id=? AND l.date BETWEEN ? AND ? AND l.date > ? ORDER BY l.date LIMIT ?'''
+DRILL_OWNER_SQL = '''SELECT h.date, h.worker_id, w.name, COUNT(*) * 0.5, w.daily_rate FROM (
+                         SELECT date, worker_id FROM logs WHERE am_owner_id=?1 AND date BETWEEN ?2 AND ?3 AND (date, worker_id) > (?4, ?5) AND am<>0
+                         UNION ALL
+                         SELECT date, worker_id FROM logs WHERE pm_owner_id=?1 AND date BETWEEN ?2 AND ?3 AND (date, worker_id) > (?4, ?5) AND pm<>0) h
+                     JOIN workers w ON w.id=h.worker_id GROUP BY h.date, h.worker_id ORDER BY h.date, h.worker_id LIMIT ?6'''
+SETTING_GET_SQL = "SELECT value FROM settings WHERE key=?"
+SETTING_SET_SQL = "INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)"
+
+_local = threading.local()
+_path = DB_FILE
+factory = sqlite3.Connection  # 连接类，诊断模式 / 基准测试换成带计数、计时的子类（profiler.Connection）
+_generation = 0  # renew() 加一；各线程取连接时发现代数变了就换新连接
+_archived = None  # 归档登记表的缓存 [(年份, 文件, 版本)]，归档 / 取消归档 / 换库后由 forget_archives() 作废
+listeners = []  # 写入提交后回调 f(表名, 键)：logs 传日期列表，workers / owners 传 id 列表，(None, None) 表示全部可能变了
+
+def connect(path=None):
+    # 自动提交模式：单条写入立即生效，多条写入用 transaction() 显式包起来
+    conn = sqlite3.connect(path or _path, isolation_level=None, cached_statements=64, factory=factory)
+    for p in PRAGMAS: conn.execute(p)
+    return conn
+
+def conn():
+    """当前线程的连接，没有就新建一条；renew() 之后第一次在事务外取用时换成新连接"""
+    c = getattr(_local, "conn", None)
+    if c is not None and _local.gen != _generation and not c.in_transaction: close(); c = None
+    if c is None:
+        _local.gen = _generation  # 先记代数再连：连接途中有人 renew() 的话，下次取用还会再换
+        c = _local.conn = connect()
+    return c
+
+def close():
+    """后台线程用完数据库后调用，释放本线程的连接"""
+    c = getattr(_local, "conn", None)
+    if c is not None: c.close(); _local.conn = None
+
+def renew():
+    """换了库文件或连接类之后调用：本线程立即换，其他线程（备份队列、预取、恢复）下次取连接时换"""
+    global _generation
+    _generation += 1
+    close()
+
+@contextmanager
+def transaction():
+    """with transaction() as c: ... 成功提交、异常回滚；嵌套时用保存点"""
+    c = conn()
+    if c.in_transaction:
+        c.execute("SAVEPOINT tx")
+        try: yield c
+        except: c.execute("ROLLBACK TO tx"); c.execute("RELEASE tx"); raise
+        else: c.execute("RELEASE tx")
+    else:
+        c.execute("BEGIN IMMEDIATE")
+        try: yield c
+        except: c.execute("ROLLBACK"); raise
+        else: c.execute("COMMIT")
+
+@contextmanager
+def triggers_paused(c):
+    """批量导入时在事务内暂停汇总和变更日志触发器，事后由调用方整体重算；其他连接看不到这个开关"""
+    c.execute("INSERT INTO trigger_pause VALUES (1)")
+    try: yield c
+    finally: c.execute("DELETE FROM trigger_pause")
+
+def init(path=None):
+    global _path
+    if path: _path = path; renew()
+    if not one("SELECT 1 FROM sqlite_master WHERE name='agg_worker'"): attach_archives()  # 汇总表要全量重算，归档年份也要读
+    with transaction() as c:
+        for sql in SCHEMA + JOURNAL: c.execute(sql)
+        migrations.migrate(c)
+        # 触发器每次启动按当前定义重建，老库里的旧定义也会被替换
+        for name, (event, body) in {**_journal_triggers(), **aggregates.TRIGGERS, **GUARD_TRIGGERS}.items():
+            c.execute(f"DROP TRIGGER IF EXISTS {name}")
+            c.execute(f"CREATE TRIGGER {name} {event} {PAUSE_WHEN} BEGIN {body} END")
+        aggregates.init(c)
+    forget_archives()
+    notify()  # 换了库文件，缓存全部作废
+
+def db_dir():
+    """热库所在目录，年度归档库和它放在一起"""
+    return os.path.dirname(os.path.abspath(_path))
+
+def notify(table=None, keys=None):
+    for f in listeners: f(table, keys)
+
+# --- 年度归档：已归档年份的 logs 在单独的库文件里（见 archive 模块），查询区间碰到这些年份时才 ATTACH ---
+# over() 把语句里的 logs 换成“热库 + 区间涉及的归档库”的 UNION ALL，条件会下推到每一段，各自照样走索引；
+# 区间没碰到归档年份时语句原样返回，日常的热点查询不受影响。汇总表一直留在热库，月报不用附加归档库。
+ARCHIVE_LIMIT = 9  # SQLite 默认一条连接最多附加 10 个库
+_LOGS = re.compile(r"\b(FROM|JOIN) logs\b")
+
+def archives(c=None):
+    """已归档的 [(年份, 文件, 版本)]；事务中途直接查表，能看到本事务里还没提交的登记"""
+    global _archived
+    c = c or conn()
+    if c.in_transaction: return c.execute("SELECT year, file, version FROM archives ORDER BY year").fetchall()
+    if _archived is None: _archived = c.execute("SELECT year, file, version FROM archives ORDER BY year").fetchall()
+    return _archived
+
+def forget_archives():
+    global _archived
+    _archived = None
+
+def is_archived(d_str):
+    return any(y == int(d_str[:4]) for y, _, _ in archives())
+
+def archive_schema(year, version):
+    return f"arc_{year}_{version}"  # 带版本：取消归档再归档后，别的连接上附加的旧文件不会被认错
+
+def attach(c, entries):
+    """确保这些归档库附加在连接 c 上，返回库名；事务里不能 ATTACH，需要的话调用方先附加好"""
+    names = [archive_schema(y, v) for y, _, v in entries]
+    if len(names) > ARCHIVE_LIMIT: raise ValueError(f"一次最多查 {ARCHIVE_LIMIT} 个归档年份，请缩小区间")
+    have = {r[1] for r in c.execute("PRAGMA database_list")}
+    todo = [(n, f) for n, (_, f, _) in zip(names, entries) if n not in have]
+    if todo:
+        if c.in_transaction: raise RuntimeError("事务中途不能附加归档库")
+        for n in have:
+            if n.startswith("arc_") and n not in names: c.execute(f"DETACH DATABASE {n}")
+        for n, f in todo: c.execute(f"ATTACH DATABASE ? AS {n}", (os.path.join(db_dir(), f),))
+    return names
+
+def attach_archives(c=None):
+    """附加全部归档库：要读全部年份又要在一个事务里做完的操作（重算汇总）先调用，事务中途不能 ATTACH"""
+    c = c or conn()
+    if c.execute("SELECT 1 FROM sqlite_master WHERE name='archives'").fetchone(): attach(c, archives(c))
+
+def over(sql, s_str=None, e_str=None, c=None):
+    """语句里的 logs 换成区间 [s_str, e_str] 的全部数据来源；不给区间就是全部年份"""
+    c = c or conn()
+    hit = [a for a in archives(c) if (s_str is None or a[0] >= int(s_str[:4])) and (e_str is None or a[0] <= int(e_str[:4]))]
+    if not hit: return sql
+    parts = [f"{n}.logs" for n in attach(c, hit)]
+    if not (s_str and e_str and len(hit) == int(e_str[:4]) - int(s_str[:4]) + 1): parts.insert(0, "main.logs")  # 区间全在归档年份里就不碰热库
+    src = parts[0] if len(parts) == 1 else "(" + " UNION ALL ".join(f"SELECT * FROM {p}" for p in parts) + ")"
+    return _LOGS.sub(lambda m: f"{m.group(1)} {src}", sql)
+
+# --- 通用查询 ---
+def execute(sql, params=()):
+    return conn().execute(sql, params)
+
+def query(sql, params=()):
+    return conn().execute(sql, params).fetchall()
+
+def one(sql, params=()):
+    return conn().execute(sql, params).fetchone()
+
+# --- 设置 ---
+def get_setting(key, default=None):
+    r = one(SETTING_GET_SQL, (key,))
+    return r[0] if r else default
+
+def set_settings(values):
+    with transaction() as c: c.executemany(SETTING_SET_SQL, list(values.items()))
+
+# --- 热点读写 ---
+def day_view(d_str, wid=None):
+    if wid is None: return query(over(DAY_ALL_SQL, d_str, d_str), (d_str,))
+    return query(over(DAY_ONE_SQL, d_str, d_str), (d_str, wid))
+
+def set_attendance(d_str, wid, ao, po, am, pm):
+    with transaction() as c:
+        aggregates.cover_years(c, int(d_str[:4]))
+        c.execute(TOGGLE_SQL, (d_str, wid, ao, po, 1 if am else 0, 1 if pm else 0))
+    notify("logs", [d_str])
+
+def set_owner(d_str, wid, period, oid):
+    with transaction() as c:
+        aggregates.cover_years(c, int(d_str[:4]))
+        c.execute(OWNER_SQL[period], (d_str, wid, oid))
+    notify("logs", [d_str])
+
+def set_attendance_many(rows):
+    """批量写整行 (日期, 工人, 上午业主, 下午业主, 上午, 下午)：一个事务、一次 executemany"""
+    with transaction() as c:
+        aggregates.cover_years(c, *{int(r[0][:4]) for r in rows})
+        c.executemany(BATCH_SQL, rows)
+    notify("logs", sorted({r[0] for r in rows}))
+
+# --- 名单 ---
+def add_worker(name, rate):
+    execute("INSERT INTO workers (name, daily_rate) VALUES (?,?)", (name, rate))
+
+def add_owner(name):
+    execute("INSERT INTO owners (name) VALUES (?)", (name,))
+
+def delete(table, row_id):
+    execute(f"DELETE FROM {table} WHERE id=?", (row_id,))
+    notify(table, [row_id])
+
+def drill_worker(wid, s_str, e_str, after=None, limit=40):
+    return query(over(DRILL_WORKER_SQL, s_str, e_str), (wid, s_str, e_str, after or "", limit))
+
+def drill_owner(oid, s_str, e_str, after=None, limit=40):
+    d, w = after or ("", 0)
+    return query(over(DRILL_OWNER_SQL, s_str, e_str), (oid, s_str, e_str, d, w, limit))